@@ -18,15 +18,18 @@ COMPILE_ARGS = ("-Wall -g -O2 -shared -fPIC"
 SSE_FLAGS = "-mfpmath=sse -msse2"
 SOURCE_FILES = [
     'pyhelper.c', 'serialqueue.c', 'stepcompress.c', 'steppersync.c',
-    'itersolve.c', 'trapq.c', 'pollreactor.c', 'msgblock.c', 'trdispatch.c',
+    'itersolve.c', 'trapq.c', 'lookahead.c', 'pollreactor.c', 'msgblock.c',
+    'trdispatch.c',
     'kin_cartesian.c', 'kin_corexy.c', 'kin_corexz.c', 'kin_delta.c',
     'kin_deltesian.c', 'kin_polar.c', 'kin_rotary_delta.c', 'kin_winch.c',
     'kin_extruder.c', 'kin_shaper.c', 'kin_idex.c', 'kin_generic.c'
 ]
 DEST_LIB = "c_helper.so"
+DEST_FFI = "c_helper_ffi.py"
 OTHER_FILES = [
     'list.h', 'serialqueue.h', 'stepcompress.h', 'steppersync.h',
-    'itersolve.h', 'pyhelper.h', 'trapq.h', 'pollreactor.h', 'msgblock.h'
+    'itersolve.h', 'pyhelper.h', 'trapq.h', 'lookahead.h', 'pollreactor.h',
+    'msgblock.h'
 ]
 
 defs_stepcompress = """
@@ -96,6 +99,12 @@ defs_trapq = """
         double start_x, start_y, start_z;
         double x_r, y_r, z_r;
     };
+    struct trapq_append_move {
+        double print_time, accel_t, cruise_t, decel_t;
+        double start_pos_x, start_pos_y, start_pos_z;
+        double axes_r_x, axes_r_y, axes_r_z;
+        double start_v, cruise_v, accel;
+    };
 
     struct trapq *trapq_alloc(void);
     void trapq_free(struct trapq *tq);
@@ -104,6 +113,8 @@ defs_trapq = """
         , double start_pos_x, double start_pos_y, double start_pos_z
         , double axes_r_x, double axes_r_y, double axes_r_z
         , double start_v, double cruise_v, double accel);
+    void trapq_append_batch(struct trapq *tq
+        , struct trapq_append_move *moves, int count);
     void trapq_finalize_moves(struct trapq *tq, double print_time
         , double clear_history_time);
     void trapq_set_position(struct trapq *tq, double print_time
@@ -112,6 +123,29 @@ defs_trapq = """
         , double start_time, double end_time);
 """
 
+defs_lookahead = """
+    struct lookahead_result {
+        double start_v, cruise_v, end_v;
+        double accel_t, cruise_t, decel_t;
+    };
+
+    struct lookahead *lookahead_alloc(void);
+    void lookahead_free(struct lookahead *la);
+    void lookahead_reset(struct lookahead *la);
+    int lookahead_add_move(struct lookahead *la
+        , double start_pos_x, double start_pos_y, double start_pos_z
+        , double axes_r_x, double axes_r_y, double axes_r_z
+        , double move_d, double accel, double junction_deviation
+        , double max_cruise_v2, double delta_v2, double mcr_delta_v2
+        , double extra_axes_v2, int is_kinematic_move);
+    void lookahead_limit_next_junction(struct lookahead *la
+        , double next_junction_v2);
+    int lookahead_flush(struct lookahead *la, int lazy
+        , struct lookahead_result *res);
+    double lookahead_queue_trapq(struct lookahead *la, struct trapq *tq
+        , double print_time);
+"""
+
 defs_kin_cartesian = """
     struct stepper_kinematics *cartesian_stepper_alloc(char axis);
 """
@@ -235,7 +269,8 @@ defs_std = """
 
 defs_all = [
     defs_pyhelper, defs_serialqueue, defs_std, defs_stepcompress,
-    defs_steppersync, defs_itersolve, defs_trapq, defs_trdispatch,
+    defs_steppersync, defs_itersolve, defs_trapq, defs_lookahead,
+    defs_trdispatch,
     defs_kin_cartesian, defs_kin_corexy, defs_kin_corexz, defs_kin_delta,
     defs_kin_deltesian, defs_kin_polar, defs_kin_rotary_delta, defs_kin_winch,
     defs_kin_extruder, defs_kin_shaper, defs_kin_idex,
@@ -300,6 +335,47 @@ def check_build_c_library():
     os.rename(tempdestlib, destlib)
     return destlib
 
+# Build (if needed) a cffi "out-of-line" python module containing the
+# pre-parsed defs_all declarations.  Loading that module avoids
+# parsing all the C declarations on every startup.
+def load_ffi_module(force_build=False):
+    srcdir = os.path.dirname(os.path.realpath(__file__))
+    destffi = get_abs_files(srcdir, [DEST_FFI])[0]
+    if force_build or check_build_code([__file__], destffi):
+        import cffi.recompiler
+        logging.info("Building cffi module %s", DEST_FFI)
+        ffi = cffi.FFI()
+        for d in defs_all:
+            ffi.cdef(d)
+        tempdestffi = get_abs_files(srcdir, ["_temp_" + DEST_FFI])[0]
+        cffi.recompiler.make_py_source(ffi, DEST_FFI[:-3], tempdestffi)
+        # Rename from temporary file to final file name
+        os.rename(tempdestffi, destffi)
+    f = open(destffi, 'r')
+    code = f.read()
+    f.close()
+    ns = {}
+    exec(compile(code, destffi, 'exec'), ns)
+    return ns['ffi']
+
+# Return an FFI object with all the defs_all declarations
+def get_ffi_main():
+    try:
+        return load_ffi_module()
+    except Exception as e:
+        logging.info("Unable to use cffi module %s (%s)", DEST_FFI, str(e))
+    # The module may have been built by a different cffi version
+    try:
+        return load_ffi_module(force_build=True)
+    except Exception as e:
+        # Fallback to parsing the declarations at runtime
+        logging.info("Unable to rebuild cffi module %s (%s)",
+                     DEST_FFI, str(e))
+    ffi = cffi.FFI()
+    for d in defs_all:
+        ffi.cdef(d)
+    return ffi
+
 FFI_main = None
 FFI_lib = None
 pyhelper_logging_callback = None
@@ -315,9 +391,7 @@ def get_ffi():
         # Check if library needs to be built, and build if so
         destlib = check_build_c_library()
         # Open library
-        FFI_main = cffi.FFI()
-        for d in defs_all:
-            FFI_main.cdef(d)
+        FFI_main = get_ffi_main()
         FFI_lib = FFI_main.dlopen(destlib)
         # Setup error logging
         pyhelper_logging_callback = FFI_main.callback("void func(const char *)",
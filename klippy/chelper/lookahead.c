@@ -0,0 +1,313 @@
+// Move "look-ahead" junction velocity planning
+//
+// Copyright (C) 2016-2025  Kevin O'Connor <kevin@koconnor.net>
+//
+// This file may be distributed under the terms of the GNU GPLv3 license.
+
+#include <math.h> // sqrt
+#include <stdlib.h> // malloc
+#include <string.h> // memset
+#include "compiler.h" // __visible
+#include "lookahead.h" // lookahead_flush
+#include "pyhelper.h" // errorf
+#include "trapq.h" // trapq_append
+
+// Common suffixes: _d is distance (in mm), _v is velocity (in
+//   mm/second), _v2 is velocity squared (mm^2/s^2), _t is time (in
+//   seconds), _r is ratio (scalar between 0.0 and 1.0)
+
+struct lookahead_move {
+    struct coord start_pos, axes_r;
+    double move_d, accel, junction_deviation;
+    double max_start_v2, max_cruise_v2, delta_v2, next_junction_v2;
+    double max_mcr_start_v2, mcr_delta_v2;
+    int is_kinematic_move;
+    // Storage for the backward pass of lookahead_flush()
+    double flush_start_v2, flush_cruise_v2, flush_end_v2;
+    int flush_has_cruise_v2;
+    // Final velocities and times of the move
+    struct lookahead_result res;
+};
+
+struct lookahead {
+    // Ring buffer of queued moves (size is always a power of two)
+    struct lookahead_move *moves;
+    int alloc, start, count;
+    // Number of moves at the start of the ring that have been flushed
+    int flushed;
+};
+
+#define INITIAL_ALLOC 256
+
+static inline struct lookahead_move *
+lookahead_get(struct lookahead *la, int pos)
+{
+    return &la->moves[(la->start + pos) & (la->alloc - 1)];
+}
+
+// Allocate a new 'lookahead' object
+struct lookahead * __visible
+lookahead_alloc(void)
+{
+    struct lookahead *la = malloc(sizeof(*la));
+    memset(la, 0, sizeof(*la));
+    la->alloc = INITIAL_ALLOC;
+    la->moves = malloc(sizeof(*la->moves) * la->alloc);
+    if (!la->moves) {
+        errorf("lookahead: unable to allocate %d moves", la->alloc);
+        free(la);
+        return NULL;
+    }
+    return la;
+}
+
+// Free memory associated with a 'lookahead' object
+void __visible
+lookahead_free(struct lookahead *la)
+{
+    if (!la)
+        return;
+    free(la->moves);
+    free(la);
+}
+
+// Remove all queued moves
+void __visible
+lookahead_reset(struct lookahead *la)
+{
+    la->start = la->count = la->flushed = 0;
+}
+
+// Remove moves from a previous flush that were not sent to a trapq
+static void
+discard_flushed(struct lookahead *la)
+{
+    la->start = (la->start + la->flushed) & (la->alloc - 1);
+    la->count -= la->flushed;
+    la->flushed = 0;
+}
+
+// Double the size of the ring buffer
+static int
+expand_moves(struct lookahead *la)
+{
+    int new_alloc = la->alloc * 2;
+    struct lookahead_move *new_moves = malloc(sizeof(*new_moves) * new_alloc);
+    if (!new_moves) {
+        errorf("lookahead: unable to allocate %d moves", new_alloc);
+        return -1;
+    }
+    int i;
+    for (i=0; i<la->count; i++)
+        new_moves[i] = *lookahead_get(la, i);
+    free(la->moves);
+    la->moves = new_moves;
+    la->alloc = new_alloc;
+    la->start = 0;
+    return 0;
+}
+
+// Calculate the maximum junction velocity between two moves
+static void
+calc_junction(struct lookahead_move *m, struct lookahead_move *pm
+              , double extra_axes_v2)
+{
+    if (!m->is_kinematic_move || !pm->is_kinematic_move)
+        return;
+    double max_start_v2 = m->max_cruise_v2;
+    if (pm->max_cruise_v2 < max_start_v2)
+        max_start_v2 = pm->max_cruise_v2;
+    if (pm->next_junction_v2 < max_start_v2)
+        max_start_v2 = pm->next_junction_v2;
+    if (pm->max_start_v2 + pm->delta_v2 < max_start_v2)
+        max_start_v2 = pm->max_start_v2 + pm->delta_v2;
+    if (extra_axes_v2 < max_start_v2)
+        max_start_v2 = extra_axes_v2;
+    // Find max velocity using "approximated centripetal velocity"
+    double junction_cos_theta = -(m->axes_r.x * pm->axes_r.x
+                                  + m->axes_r.y * pm->axes_r.y
+                                  + m->axes_r.z * pm->axes_r.z);
+    double sin_theta_d2 = sqrt(fmax(0.5*(1.0-junction_cos_theta), 0.));
+    double cos_theta_d2 = sqrt(fmax(0.5*(1.0+junction_cos_theta), 0.));
+    double one_minus_sin_theta_d2 = 1. - sin_theta_d2;
+    if (one_minus_sin_theta_d2 > 0. && cos_theta_d2 > 0.) {
+        double R_jd = sin_theta_d2 / one_minus_sin_theta_d2;
+        double move_jd_v2 = R_jd * m->junction_deviation * m->accel;
+        double pmove_jd_v2 = R_jd * pm->junction_deviation * pm->accel;
+        // Approximated circle must contact moves no further than mid-move
+        double quarter_tan_theta_d2 = .25 * sin_theta_d2 / cos_theta_d2;
+        double move_centripetal_v2 = m->delta_v2 * quarter_tan_theta_d2;
+        double pmove_centripetal_v2 = pm->delta_v2 * quarter_tan_theta_d2;
+        if (move_jd_v2 < max_start_v2)
+            max_start_v2 = move_jd_v2;
+        if (pmove_jd_v2 < max_start_v2)
+            max_start_v2 = pmove_jd_v2;
+        if (move_centripetal_v2 < max_start_v2)
+            max_start_v2 = move_centripetal_v2;
+        if (pmove_centripetal_v2 < max_start_v2)
+            max_start_v2 = pmove_centripetal_v2;
+    }
+    // Apply limits
+    m->max_start_v2 = max_start_v2;
+    m->max_mcr_start_v2 = pm->max_mcr_start_v2 + pm->mcr_delta_v2;
+    if (max_start_v2 < m->max_mcr_start_v2)
+        m->max_mcr_start_v2 = max_start_v2;
+}
+
+// Add a move to the look-ahead queue (returns non-zero on error)
+int __visible
+lookahead_add_move(struct lookahead *la
+                   , double start_pos_x, double start_pos_y, double start_pos_z
+                   , double axes_r_x, double axes_r_y, double axes_r_z
+                   , double move_d, double accel, double junction_deviation
+                   , double max_cruise_v2, double delta_v2
+                   , double mcr_delta_v2, double extra_axes_v2
+                   , int is_kinematic_move)
+{
+    discard_flushed(la);
+    if (la->count >= la->alloc && expand_moves(la))
+        return -1;
+    struct lookahead_move *m = lookahead_get(la, la->count);
+    memset(m, 0, sizeof(*m));
+    m->start_pos.x = start_pos_x;
+    m->start_pos.y = start_pos_y;
+    m->start_pos.z = start_pos_z;
+    m->axes_r.x = axes_r_x;
+    m->axes_r.y = axes_r_y;
+    m->axes_r.z = axes_r_z;
+    m->move_d = move_d;
+    m->accel = accel;
+    m->junction_deviation = junction_deviation;
+    m->max_cruise_v2 = max_cruise_v2;
+    m->delta_v2 = delta_v2;
+    m->next_junction_v2 = 999999999.9;
+    m->mcr_delta_v2 = mcr_delta_v2;
+    m->is_kinematic_move = is_kinematic_move;
+    la->count++;
+    if (la->count > 1)
+        calc_junction(m, lookahead_get(la, la->count - 2), extra_axes_v2);
+    return 0;
+}
+
+// Limit the velocity at the end of the last queued move
+void __visible
+lookahead_limit_next_junction(struct lookahead *la, double next_junction_v2)
+{
+    if (la->count <= la->flushed)
+        return;
+    struct lookahead_move *m = lookahead_get(la, la->count - 1);
+    if (next_junction_v2 < m->next_junction_v2)
+        m->next_junction_v2 = next_junction_v2;
+}
+
+// Set the final velocities and times of a move
+static void
+set_junction(struct lookahead_move *m
+             , double start_v2, double cruise_v2, double end_v2)
+{
+    // Determine accel, cruise, and decel portions of the move distance
+    double half_inv_accel = .5 / m->accel;
+    double accel_d = (cruise_v2 - start_v2) * half_inv_accel;
+    double decel_d = (cruise_v2 - end_v2) * half_inv_accel;
+    double cruise_d = m->move_d - accel_d - decel_d;
+    // Determine move velocities
+    double start_v = m->res.start_v = sqrt(start_v2);
+    double cruise_v = m->res.cruise_v = sqrt(cruise_v2);
+    double end_v = m->res.end_v = sqrt(end_v2);
+    // Determine time spent in each portion of move (time is the
+    // distance divided by average velocity)
+    m->res.accel_t = accel_d / ((start_v + cruise_v) * 0.5);
+    m->res.cruise_t = cruise_d / cruise_v;
+    m->res.decel_t = decel_d / ((end_v + cruise_v) * 0.5);
+}
+
+// Determine the velocities of queued moves.  Returns the number of
+// moves that were flushed (their results are stored in 'res').
+int __visible
+lookahead_flush(struct lookahead *la, int lazy, struct lookahead_result *res)
+{
+    discard_flushed(la);
+    int update_flush_count = lazy;
+    int flush_count = la->count;
+    // Traverse queue from last to first move and determine maximum
+    // junction speed assuming the robot comes to a complete stop
+    // after the last move.
+    double next_start_v2 = 0., next_mcr_start_v2 = 0., peak_cruise_v2 = 0.;
+    int pending_cv2_assign = 0, i;
+    for (i=flush_count-1; i>=0; i--) {
+        struct lookahead_move *m = lookahead_get(la, i);
+        double reachable_start_v2 = next_start_v2 + m->delta_v2;
+        double start_v2 = m->max_start_v2;
+        if (reachable_start_v2 < start_v2)
+            start_v2 = reachable_start_v2;
+        m->flush_has_cruise_v2 = 0;
+        pending_cv2_assign++;
+        double reach_mcr_start_v2 = next_mcr_start_v2 + m->mcr_delta_v2;
+        double mcr_start_v2 = m->max_mcr_start_v2;
+        if (reach_mcr_start_v2 < mcr_start_v2)
+            mcr_start_v2 = reach_mcr_start_v2;
+        if (mcr_start_v2 < reach_mcr_start_v2) {
+            // It's possible for this move to accelerate
+            if (mcr_start_v2 + m->mcr_delta_v2 > next_mcr_start_v2
+                || pending_cv2_assign > 1) {
+                // This move can both accel and decel, or this is a
+                // full accel move followed by a full decel move
+                if (update_flush_count && peak_cruise_v2) {
+                    flush_count = i + pending_cv2_assign;
+                    update_flush_count = 0;
+                }
+                peak_cruise_v2 = (mcr_start_v2 + reach_mcr_start_v2) * .5;
+            }
+            double cruise_v2 = (start_v2 + reachable_start_v2) * .5;
+            if (m->max_cruise_v2 < cruise_v2)
+                cruise_v2 = m->max_cruise_v2;
+            if (peak_cruise_v2 < cruise_v2)
+                cruise_v2 = peak_cruise_v2;
+            m->flush_cruise_v2 = cruise_v2;
+            m->flush_has_cruise_v2 = 1;
+            pending_cv2_assign = 0;
+        }
+        m->flush_start_v2 = start_v2;
+        m->flush_end_v2 = next_start_v2;
+        next_start_v2 = start_v2;
+        next_mcr_start_v2 = mcr_start_v2;
+    }
+    if (update_flush_count || !flush_count)
+        return 0;
+    // Traverse queue in forward direction to propagate cruise_v2
+    double prev_cruise_v2 = 0.;
+    for (i=0; i<flush_count; i++) {
+        struct lookahead_move *m = lookahead_get(la, i);
+        double start_v2 = m->flush_start_v2, cruise_v2 = m->flush_cruise_v2;
+        if (!m->flush_has_cruise_v2)
+            // This move can't accelerate - propagate cruise_v2 from previous
+            cruise_v2 = fmin(prev_cruise_v2, start_v2);
+        set_junction(m, fmin(start_v2, cruise_v2), cruise_v2
+                     , fmin(m->flush_end_v2, cruise_v2));
+        prev_cruise_v2 = cruise_v2;
+        res[i] = m->res;
+    }
+    la->flushed = flush_count;
+    return flush_count;
+}
+
+// Add the kinematic moves of the last flush to a trapq and remove
+// them from the look-ahead queue.  Returns the end time of the moves.
+double __visible
+lookahead_queue_trapq(struct lookahead *la, struct trapq *tq
+                      , double print_time)
+{
+    int i;
+    for (i=0; i<la->flushed; i++) {
+        struct lookahead_move *m = lookahead_get(la, i);
+        struct lookahead_result *r = &m->res;
+        if (m->is_kinematic_move)
+            trapq_append(tq, print_time, r->accel_t, r->cruise_t, r->decel_t
+                         , m->start_pos.x, m->start_pos.y, m->start_pos.z
+                         , m->axes_r.x, m->axes_r.y, m->axes_r.z
+                         , r->start_v, r->cruise_v, m->accel);
+        print_time = print_time + r->accel_t + r->cruise_t + r->decel_t;
+    }
+    discard_flushed(la);
+    return print_time;
+}
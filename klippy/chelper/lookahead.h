@@ -0,0 +1,26 @@
+#ifndef LOOKAHEAD_H
+#define LOOKAHEAD_H
+
+struct lookahead_result {
+    double start_v, cruise_v, end_v;
+    double accel_t, cruise_t, decel_t;
+};
+
+struct trapq;
+struct lookahead *lookahead_alloc(void);
+void lookahead_free(struct lookahead *la);
+void lookahead_reset(struct lookahead *la);
+int lookahead_add_move(struct lookahead *la
+    , double start_pos_x, double start_pos_y, double start_pos_z
+    , double axes_r_x, double axes_r_y, double axes_r_z
+    , double move_d, double accel, double junction_deviation
+    , double max_cruise_v2, double delta_v2, double mcr_delta_v2
+    , double extra_axes_v2, int is_kinematic_move);
+void lookahead_limit_next_junction(struct lookahead *la
+                                   , double next_junction_v2);
+int lookahead_flush(struct lookahead *la, int lazy
+                    , struct lookahead_result *res);
+double lookahead_queue_trapq(struct lookahead *la, struct trapq *tq
+                             , double print_time);
+
+#endif // lookahead.h
@@ -164,6 +164,22 @@ trapq_append(struct trapq *tq, double print_time
     }
 }
 
+// Add an array of moves to the trapezoid velocity queue
+void __visible
+trapq_append_batch(struct trapq *tq, struct trapq_append_move *moves
+                   , int count)
+{
+    int i;
+    for (i=0; i<count; i++) {
+        struct trapq_append_move *am = &moves[i];
+        trapq_append(tq, am->print_time
+                     , am->accel_t, am->cruise_t, am->decel_t
+                     , am->start_pos_x, am->start_pos_y, am->start_pos_z
+                     , am->axes_r_x, am->axes_r_y, am->axes_r_z
+                     , am->start_v, am->cruise_v, am->accel);
+    }
+}
+
 // Expire any moves older than `print_time` from the trapezoid velocity queue
 void __visible
 trapq_finalize_moves(struct trapq *tq, double print_time
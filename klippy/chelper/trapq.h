@@ -31,6 +31,13 @@ struct pull_move {
     double x_r, y_r, z_r;
 };
 
+struct trapq_append_move {
+    double print_time, accel_t, cruise_t, decel_t;
+    double start_pos_x, start_pos_y, start_pos_z;
+    double axes_r_x, axes_r_y, axes_r_z;
+    double start_v, cruise_v, accel;
+};
+
 struct move *move_alloc(void);
 double move_get_distance(struct move *m, double move_time);
 struct coord move_get_coord(struct move *m, double move_time);
@@ -43,6 +50,8 @@ void trapq_append(struct trapq *tq, double print_time
                   , double start_pos_x, double start_pos_y, double start_pos_z
                   , double axes_r_x, double axes_r_y, double axes_r_z
                   , double start_v, double cruise_v, double accel);
+void trapq_append_batch(struct trapq *tq, struct trapq_append_move *moves
+                        , int count);
 void trapq_finalize_moves(struct trapq *tq, double print_time
                           , double clear_history_time);
 void trapq_set_position(struct trapq *tq, double print_time
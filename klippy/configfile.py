@@ -3,7 +3,7 @@
 # Copyright (C) 2016-2024  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import sys, os, glob, re, time, logging, configparser, io
+import sys, os, glob, re, time, logging, configparser, io, json, hashlib
 
 error = configparser.Error
 
@@ -138,7 +138,14 @@ class ConfigWrapper:
 # Config file parsing (with include file support)
 ######################################################################
 
+def _hash_data(data):
+    return hashlib.sha1(data.encode()).hexdigest()
+
 class ConfigFileReader:
+    def __init__(self):
+        # Files read (and include globs resolved) for use by ConfigCache
+        self.file_hashes = {}
+        self.include_globs = []
     def read_config_file(self, filename):
         try:
             f = open(filename, 'r')
@@ -148,6 +155,7 @@ class ConfigFileReader:
             msg = "Unable to open config file %s" % (filename,)
             logging.exception(msg)
             raise error(msg)
+        self.file_hashes[os.path.abspath(filename)] = _hash_data(data)
         return data.replace('\r\n', '\n')
     def build_config_string(self, fileconfig):
         sfile = io.StringIO()
@@ -188,6 +196,7 @@ class ConfigFileReader:
             # Empty set is OK if wildcard but not for direct file reference
             raise error("Include file '%s' does not exist" % (include_glob,))
         include_filenames.sort()
+        self.include_globs.append((include_glob, include_filenames))
         for include_filename in include_filenames:
             include_data = self.read_config_file(include_filename)
             self._parse_config(include_data, include_filename, fileconfig,
@@ -226,6 +235,103 @@ class ConfigFileReader:
         return fileconfig
 
 
+######################################################################
+# Parsed config cache
+######################################################################
+
+CONFIG_CACHE_VERSION = 1
+
+# Store the fully resolved config (after include and autosave
+# processing) along with the hashes of all the files it was built from
+class ConfigCache:
+    def __init__(self, filename, config_file):
+        self.filename = filename
+        self.config_file = os.path.abspath(config_file)
+    def _dump_fileconfig(self, fileconfig):
+        # Only store the options of each section (items() also reports
+        # any options inherited from [DEFAULT])
+        defaults = fileconfig.defaults()
+        sections = [[section, [(option, value) for option, value
+                               in fileconfig.items(section, raw=True)
+                               if defaults.get(option) != value]]
+                    for section in fileconfig.sections()]
+        return {'defaults': list(defaults.items()),
+                'sections': sections}
+    def _load_fileconfig(self, cfgrdr, data):
+        fileconfig = cfgrdr._create_fileconfig()
+        fileconfig.defaults().update(data['defaults'])
+        for section, options in data['sections']:
+            fileconfig.add_section(section)
+            for option, value in options:
+                fileconfig.set(section, option, value)
+        return fileconfig
+    def _is_current(self, cache):
+        if cache.get('version') != CONFIG_CACHE_VERSION:
+            return False
+        if cache['config_file'] != self.config_file:
+            return False
+        for include_glob, include_filenames in cache['include_globs']:
+            if sorted(glob.glob(include_glob)) != include_filenames:
+                return False
+        for filename, file_hash in cache['file_hashes'].items():
+            try:
+                f = open(filename, 'r')
+                data = f.read()
+                f.close()
+            except (IOError, OSError):
+                return False
+            if _hash_data(data) != file_hash:
+                return False
+        return True
+    def load(self, cfgrdr):
+        try:
+            f = open(self.filename, 'r')
+            cache = json.load(f)
+            f.close()
+        except (IOError, OSError):
+            return None
+        except ValueError:
+            logging.warning("Ignoring corrupted config cache '%s'",
+                            self.filename)
+            return None
+        try:
+            if not self._is_current(cache):
+                logging.info("Config cache '%s' is out of date",
+                             self.filename)
+                return None
+            regular_fileconfig = self._load_fileconfig(cfgrdr,
+                                                       cache['regular'])
+            autosave_fileconfig = self._load_fileconfig(cfgrdr,
+                                                        cache['autosave'])
+        except (KeyError, TypeError, ValueError, configparser.Error):
+            logging.warning("Ignoring invalid config cache '%s'",
+                            self.filename)
+            return None
+        logging.info("Loaded config from cache '%s'", self.filename)
+        return regular_fileconfig, autosave_fileconfig
+    def save(self, cfgrdr, regular_fileconfig, autosave_fileconfig):
+        cache = {'version': CONFIG_CACHE_VERSION,
+                 'config_file': self.config_file,
+                 'file_hashes': cfgrdr.file_hashes,
+                 'include_globs': cfgrdr.include_globs,
+                 'regular': self._dump_fileconfig(regular_fileconfig),
+                 'autosave': self._dump_fileconfig(autosave_fileconfig)}
+        temp_name = self.filename + ".tmp"
+        try:
+            f = open(temp_name, 'w')
+            json.dump(cache, f)
+            f.close()
+            os.rename(temp_name, self.filename)
+        except (IOError, OSError):
+            logging.exception("Unable to write config cache '%s'",
+                              self.filename)
+    def invalidate(self):
+        try:
+            os.remove(self.filename)
+        except OSError:
+            pass
+
+
 ######################################################################
 # Config auto save helper
 ######################################################################
@@ -292,9 +398,21 @@ class ConfigAutoSave:
                 is_dup_field = True
                 lines[lineno] = '#' + lines[lineno]
         return "\n".join(lines)
+    def _get_config_cache(self):
+        start_args = self.printer.get_start_args()
+        cache_filename = start_args.get('config_cache')
+        if cache_filename is None:
+            return None
+        return ConfigCache(cache_filename, start_args['config_file'])
     def load_main_config(self):
-        filename = self.printer.get_start_args()['config_file']
         cfgrdr = ConfigFileReader()
+        config_cache = self._get_config_cache()
+        if config_cache is not None:
+            res = config_cache.load(cfgrdr)
+            if res is not None:
+                regular_fileconfig, self.fileconfig = res
+                return res
+        filename = self.printer.get_start_args()['config_file']
         data = cfgrdr.read_config_file(filename)
         regular_data, autosave_data = self._find_autosave_data(data)
         regular_fileconfig = cfgrdr.build_fileconfig_with_includes(
@@ -304,6 +422,8 @@ class ConfigAutoSave:
         self.fileconfig = cfgrdr.build_fileconfig(autosave_data, filename)
         cfgrdr.append_fileconfig(regular_fileconfig,
                                  autosave_data, '*AUTOSAVE*')
+        if config_cache is not None:
+            config_cache.save(cfgrdr, regular_fileconfig, self.fileconfig)
         return regular_fileconfig, self.fileconfig
     def get_status(self, eventtime):
         return {'save_config_pending': self.save_config_pending,
@@ -394,6 +514,9 @@ class ConfigAutoSave:
             f.close()
             os.rename(cfgname, backup_name)
             os.rename(temp_name, cfgname)
+            config_cache = self._get_config_cache()
+            if config_cache is not None:
+                config_cache.invalidate()
         except:
             msg = "Unable to write config file during SAVE_CONFIG"
             logging.exception(msg)
@@ -464,6 +587,7 @@ class PrinterConfig:
         self.deprecated = {}
         self.status_raw_config = {}
         self.status_warnings = []
+        self.status_version = 0
     def get_printer(self):
         return self.printer
     def read_config(self, filename):
@@ -487,6 +611,7 @@ class PrinterConfig:
         self.printer.set_rollover_info("config", "\n".join(lines))
     def check_unused_options(self, config):
         self.validate.check_unused(config.fileconfig)
+        self.status_version += 1
     # Deprecation warnings
     def _add_deprecated(self, data):
         key = tuple(list(data.items()))
@@ -494,6 +619,7 @@ class PrinterConfig:
             return False
         self.deprecated[key] = True
         self.status_warnings = self.status_warnings + [data]
+        self.status_version += 1
         return True
     def runtime_warning(self, msg):
         res = {'type': 'runtime_warning', 'message': msg}
@@ -547,6 +673,9 @@ class PrinterConfig:
             self.status_raw_config[section.get_name()] = section_status = {}
             for option in section.get_prefix_options(''):
                 section_status[option] = section.get(option, note_valid=False)
+        self.status_version += 1
+    def get_status_version(self):
+        return self.status_version
     def get_status(self, eventtime):
         status = {'config': self.status_raw_config,
                   'warnings': self.status_warnings}
@@ -556,5 +685,7 @@ class PrinterConfig:
     # Autosave functions
     def set(self, section, option, value):
         self.autosave.set(section, option, value)
+        self.status_version += 1
     def remove_section(self, section):
         self.autosave.remove_section(section)
+        self.status_version += 1
@@ -184,6 +184,26 @@ def read_axes_map(config, scale_x, scale_y, scale_z):
         raise config.error("Invalid axes_map parameter")
     return [am[a.strip()] for a in axes_map]
 
+# Lookup table of scaled (and rounded) values for raw sensor readings
+class ScaledValueCache(dict):
+    def __init__(self, scale):
+        dict.__init__(self)
+        self.scale = scale
+    def __missing__(self, raw):
+        val = self[raw] = round(raw * self.scale, 6)
+        return val
+
+# Helper to convert columns of raw x, y, z readings into scaled samples
+class AccelConverter:
+    def __init__(self, axes_map):
+        self.axes = [(pos, ScaledValueCache(scale)) for pos, scale in axes_map]
+    def convert(self, times, raw_xyz):
+        (x_pos, x_cache), (y_pos, y_cache), (z_pos, z_cache) = self.axes
+        return list(zip([round(t, 6) for t in times],
+                        [x_cache[v] for v in raw_xyz[x_pos]],
+                        [y_cache[v] for v in raw_xyz[y_pos]],
+                        [z_cache[v] for v in raw_xyz[z_pos]]))
+
 BATCH_UPDATES = 0.100
 
 # Printer class that controls ADXL345 chip
@@ -192,6 +212,7 @@ class ADXL345:
         self.printer = config.get_printer()
         AccelCommandHelper(config, self)
         self.axes_map = read_axes_map(config, SCALE_XY, SCALE_XY, SCALE_Z)
+        self.accel_conv = AccelConverter(self.axes_map)
         self.data_rate = config.getint('rate', 3200)
         if self.data_rate not in QUERY_RATES:
             raise config.error("Invalid rate parameter: %d" % (self.data_rate,))
@@ -241,24 +262,22 @@ class ADXL345:
         self.batch_bulk.add_client(aqh.handle_batch)
         return aqh
     # Measurement decoding
-    def _convert_samples(self, samples):
-        (x_pos, x_scale), (y_pos, y_scale), (z_pos, z_scale) = self.axes_map
-        count = 0
-        for ptime, xlow, ylow, zlow, xzhigh, yzhigh in samples:
-            if yzhigh & 0x80:
-                self.last_error_count += 1
-                continue
-            rx = (xlow | ((xzhigh & 0x1f) << 8)) - ((xzhigh & 0x10) << 9)
-            ry = (ylow | ((yzhigh & 0x1f) << 8)) - ((yzhigh & 0x10) << 9)
-            rz = ((zlow | ((xzhigh & 0xe0) << 3) | ((yzhigh & 0xe0) << 6))
-                  - ((yzhigh & 0x40) << 7))
-            raw_xyz = (rx, ry, rz)
-            x = round(raw_xyz[x_pos] * x_scale, 6)
-            y = round(raw_xyz[y_pos] * y_scale, 6)
-            z = round(raw_xyz[z_pos] * z_scale, 6)
-            samples[count] = (round(ptime, 6), x, y, z)
-            count += 1
-        del samples[count:]
+    def _convert_samples(self, columns):
+        times, xlow, ylow, zlow, xzhigh, yzhigh = columns
+        if yzhigh and max(yzhigh) & 0x80:
+            # Discard samples that the mcu flagged as invalid
+            valid = [i for i, v in enumerate(yzhigh) if not v & 0x80]
+            self.last_error_count += len(yzhigh) - len(valid)
+            times, xlow, ylow, zlow, xzhigh, yzhigh = [
+                [col[i] for i in valid] for col in columns]
+        rx = [(xl | ((xzh & 0x1f) << 8)) - ((xzh & 0x10) << 9)
+              for xl, xzh in zip(xlow, xzhigh)]
+        ry = [(yl | ((yzh & 0x1f) << 8)) - ((yzh & 0x10) << 9)
+              for yl, yzh in zip(ylow, yzhigh)]
+        rz = [(zl | ((xzh & 0xe0) << 3) | ((yzh & 0xe0) << 6))
+              - ((yzh & 0x40) << 7)
+              for zl, xzh, yzh in zip(zlow, xzhigh, yzhigh)]
+        return self.accel_conv.convert(times, (rx, ry, rz))
     # Start, stop, and process message batches
     def _start_measurements(self):
         # In case of miswiring, testing ADXL345 device ID prevents treating
@@ -291,8 +310,8 @@ class ADXL345:
         self.ffreader.note_end()
         logging.info("ADXL345 finished '%s' measurements", self.name)
     def _process_batch(self, eventtime):
-        samples = self.ffreader.pull_samples()
-        self._convert_samples(samples)
+        columns = self.ffreader.pull_sample_columns()
+        samples = self._convert_samples(columns)
         if not samples:
             return {}
         return {'data': samples, 'errors': self.last_error_count,
@@ -3,9 +3,16 @@
 # Copyright (C) 2018-2019 Eric Callahan <arksine.code@gmail.com>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import logging, math, json, collections
+import logging, math, json, collections, struct, base64, zlib
+import mathutil
 from . import probe
 
+try:
+    import numpy
+except ImportError:
+    # Mesh interpolation falls back to the (slower) pure python code
+    numpy = None
+
 PROFILE_VERSION = 1
 PROFILE_OPTIONS = {
     'min_x': float, 'max_x': float, 'min_y': float, 'max_y': float,
@@ -13,6 +20,38 @@ PROFILE_OPTIONS = {
     'algo': str, 'tension': float
 }
 
+# Compact profiles store points as base64 encoded little-endian floats
+PROFILE_FORMATS = {'text': 'text', 'compact': 'compact'}
+PACKED_LINE_LENGTH = 76
+
+def _crc32(data):
+    return zlib.crc32(data) & 0xffffffff
+
+def pack_points(probed_matrix):
+    flat = [z for line in probed_matrix for z in line]
+    data = struct.pack('<%df' % (len(flat),), *flat)
+    packed = base64.b64encode(data).decode()
+    lines = [packed[i:i+PACKED_LINE_LENGTH]
+             for i in range(0, len(packed), PACKED_LINE_LENGTH)]
+    return "".join(["\n  " + line for line in lines]), _crc32(data)
+
+def unpack_points(packed, crc, x_count, y_count):
+    try:
+        data = base64.b64decode(packed)
+    except (ValueError, TypeError):
+        raise BedMeshError("Invalid encoding of packed points")
+    if len(data) != 4 * x_count * y_count:
+        raise BedMeshError("Packed points do not match the mesh size")
+    if _crc32(data) != crc:
+        raise BedMeshError("Packed points checksum mismatch")
+    flat = struct.unpack('<%df' % (x_count * y_count,), data)
+    return [list(flat[i:i+x_count])
+            for i in range(0, len(flat), x_count)]
+
+# Interpolated meshes with at least this many points are built in a
+# background process (when numpy is not available)
+BACKGROUND_MESH_POINTS = 2500
+
 class BedMeshError(Exception):
     pass
 
@@ -250,6 +289,24 @@ class BedMesh:
             self.status['mesh_matrix'] = mesh_matrix
     def get_mesh(self):
         return self.z_mesh
+    def build_mesh(self, params, name, probed_matrix):
+        z_mesh = ZMesh(params, name)
+        if (numpy is not None or params['algo'] == 'direct'
+            or z_mesh.get_point_count() < BACKGROUND_MESH_POINTS):
+            try:
+                z_mesh.build_mesh(probed_matrix)
+            except BedMeshError as e:
+                raise self.gcode.error(str(e))
+            return z_mesh
+        # Interpolate in a background process so that the reactor is
+        # not blocked while processing a large mesh in pure python
+        err, mesh_matrix = mathutil.background_call(
+            self.printer, "bed mesh", _interpolate_mesh, z_mesh,
+            probed_matrix)
+        if err is not None:
+            raise self.gcode.error(err)
+        z_mesh.build_mesh(probed_matrix, mesh_matrix)
+        return z_mesh
     cmd_BED_MESH_OUTPUT_help = "Retrieve interpolated grid of probed z-points"
     def cmd_BED_MESH_OUTPUT(self, gcmd):
         if gcmd.get_int('PGP', 0):
@@ -771,11 +828,8 @@ class BedMeshCalibrate:
                         "Probed table length: %d Probed Table:\n%s") %
                     (len(probed_matrix), str(probed_matrix)))
 
-        z_mesh = ZMesh(params, self._profile_name)
-        try:
-            z_mesh.build_mesh(probed_matrix)
-        except BedMeshError as e:
-            raise self.gcode.error(str(e))
+        z_mesh = self.bedmesh.build_mesh(params, self._profile_name,
+                                         probed_matrix)
         if self.probe_mgr.get_zero_ref_mode() == ZrefMode.IN_MESH:
             # The reference can be anywhere in the mesh, therefore
             # it is necessary to set the reference after the initial mesh
@@ -1269,59 +1323,45 @@ class MoveSplitter:
     def build_move(self, prev_pos, next_pos, factor):
         self.prev_pos = tuple(prev_pos)
         self.next_pos = tuple(next_pos)
-        self.current_pos = list(prev_pos)
         self.z_factor = factor
-        self.z_offset = self._calc_z_offset(prev_pos)
         self.traverse_complete = False
-        self.distance_checked = 0.
         axes_d = [np - pp for np, pp in zip(self.next_pos, self.prev_pos)]
-        self.total_move_length = math.sqrt(sum([d*d for d in axes_d[:3]]))
+        total_move_length = math.sqrt(sum([d*d for d in axes_d[:3]]))
         self.axis_move = [not isclose(d, 0., abs_tol=1e-10) for d in axes_d]
+        self.split_times = []
+        self.split_index = 0
+        if (self.axis_move[0] or self.axis_move[1]) and factor:
+            # X and/or Y axis move, find where the Z offset changes by
+            # split_delta_z (splits are at least move_check_distance apart)
+            self.split_times = self.z_mesh.find_z_splits(
+                self.prev_pos, self.next_pos, self.split_delta_z / factor,
+                self.move_check_distance / total_move_length)
     def _calc_z_offset(self, pos):
         z = self.z_mesh.calc_z(pos[0], pos[1])
         offset = self.fade_offset
         return self.z_factor * (z - offset) + offset
-    def _set_next_move(self, distance_from_prev):
-        t = distance_from_prev / self.total_move_length
-        if t > 1. or t < 0.:
-            raise self.gcode.error(
-                "bed_mesh: Slice distance is negative "
-                "or greater than entire move length")
-        for i in range(len(self.next_pos)):
-            if self.axis_move[i]:
-                self.current_pos[i] = lerp(
-                    t, self.prev_pos[i], self.next_pos[i])
     def split(self):
-        if not self.traverse_complete:
-            if self.axis_move[0] or self.axis_move[1]:
-                # X and/or Y axis move, traverse if necessary
-                while self.distance_checked + self.move_check_distance \
-                        < self.total_move_length:
-                    self.distance_checked += self.move_check_distance
-                    self._set_next_move(self.distance_checked)
-                    next_z = self._calc_z_offset(self.current_pos)
-                    if abs(next_z - self.z_offset) >= self.split_delta_z:
-                        self.z_offset = next_z
-                        newpos = list(self.current_pos)
-                        newpos[2] += self.z_offset
-                        return newpos
+        if self.traverse_complete:
+            return None
+        if self.split_index < len(self.split_times):
+            t = self.split_times[self.split_index]
+            self.split_index += 1
+            newpos = [lerp(t, pp, np) if move else pp
+                      for pp, np, move in zip(self.prev_pos, self.next_pos,
+                                              self.axis_move)]
+        else:
             # end of move reached
-            self.current_pos[:] = self.next_pos
-            self.z_offset = self._calc_z_offset(self.current_pos)
-            # Its okay to add Z-Offset to the final move, since it will not be
-            # used again.
-            self.current_pos[2] += self.z_offset
+            newpos = list(self.next_pos)
             self.traverse_complete = True
-            return self.current_pos
-        else:
-            # Traverse complete
-            return None
+        newpos[2] += self._calc_z_offset(newpos)
+        return newpos
 
 
 class ZMesh:
     def __init__(self, params, name):
         self.profile_name = name or "adaptive-%X" % (id(self),)
         self.probed_matrix = self.mesh_matrix = None
+        self.cell_coeffs = self.cell_bounds = self.coeff_array = None
         self.mesh_params = params
         self.mesh_offsets = [0., 0.]
         logging.debug('bed_mesh: probe/mesh parameters:')
@@ -1341,6 +1381,9 @@ class ZMesh:
             'bicubic': self._sample_bicubic,
             'direct': self._sample_direct
         }
+        if numpy is not None:
+            interpolation_algos['lagrange'] = self._sample_lagrange_numpy
+            interpolation_algos['bicubic'] = self._sample_bicubic_numpy
         self._sample = interpolation_algos.get(params['algo'])
         # Number of points to interpolate per segment
         mesh_x_pps = params['mesh_x_pps']
@@ -1402,10 +1445,35 @@ class ZMesh:
             print_func(msg)
         else:
             print_func("bed_mesh: Z Mesh not generated")
-    def build_mesh(self, z_matrix):
+    def get_point_count(self):
+        return self.mesh_x_count * self.mesh_y_count
+    def build_mesh(self, z_matrix, mesh_matrix=None):
         self.probed_matrix = z_matrix
-        self._sample(z_matrix)
-        self.print_mesh(logging.debug)
+        if mesh_matrix is None:
+            self._sample(z_matrix)
+        else:
+            # Mesh was interpolated elsewhere (eg, in a background process)
+            self.mesh_matrix = mesh_matrix
+        self._build_mesh_tables()
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            self.print_mesh(logging.debug)
+    def _build_mesh_tables(self):
+        tbl = self.mesh_matrix
+        if tbl is None:
+            return
+        # The Z of each cell is z00 + zx*tx + zy*ty + zxy*tx*ty, where tx
+        # and ty are the position within the cell (from 0 to 1)
+        self.cell_coeffs = [
+            [(z00, z10 - z00, z01 - z00, z11 - z10 - z01 + z00)
+             for z00, z10, z01, z11 in zip(row0[:-1], row0[1:],
+                                           row1[:-1], row1[1:])]
+            for row0, row1 in zip(tbl[:-1], tbl[1:])]
+        self.cell_bounds = [
+            [(min(corners), max(corners))
+             for corners in zip(row0[:-1], row0[1:], row1[:-1], row1[1:])]
+            for row0, row1 in zip(tbl[:-1], tbl[1:])]
+        if numpy is not None:
+            self.coeff_array = numpy.array(self.cell_coeffs, dtype=float)
     def set_zero_reference(self, xpos, ypos):
         offset = self.calc_z(xpos, ypos)
         logging.info(
@@ -1416,6 +1484,7 @@ class ZMesh:
             for yidx in range(len(matrix)):
                 for xidx in range(len(matrix[yidx])):
                     matrix[yidx][xidx] -= offset
+        self._build_mesh_tables()
     def set_mesh_offsets(self, offsets):
         for i, o in enumerate(offsets):
             if o is not None:
@@ -1426,15 +1495,134 @@ class ZMesh:
         return self.mesh_y_min + self.mesh_y_dist * index
     def calc_z(self, x, y):
         if self.mesh_matrix is not None:
-            tbl = self.mesh_matrix
             tx, xidx = self._get_linear_index(x + self.mesh_offsets[0], 0)
             ty, yidx = self._get_linear_index(y + self.mesh_offsets[1], 1)
-            z0 = lerp(tx, tbl[yidx][xidx], tbl[yidx][xidx+1])
-            z1 = lerp(tx, tbl[yidx+1][xidx], tbl[yidx+1][xidx+1])
-            return lerp(ty, z0, z1)
+            z00, zx, zy, zxy = self.cell_coeffs[yidx][xidx]
+            return z00 + zx * tx + (zy + zxy * tx) * ty
         else:
             # No mesh table generated, no z-adjustment
             return 0.
+    def _get_crossings(self, start, delta, axis):
+        # Return the fractions along a line at which it crosses a mesh
+        # line (including the mesh boundaries) on the given axis
+        if axis == 0:
+            mesh_min = self.mesh_x_min
+            mesh_cnt = self.mesh_x_count
+            mesh_dist = self.mesh_x_dist
+        else:
+            mesh_min = self.mesh_y_min
+            mesh_cnt = self.mesh_y_count
+            mesh_dist = self.mesh_y_dist
+        if not delta:
+            return []
+        end = start + delta
+        first = int(math.ceil((min(start, end) - mesh_min) / mesh_dist))
+        last = int(math.floor((max(start, end) - mesh_min) / mesh_dist))
+        times = [(mesh_min + i * mesh_dist - start) / delta
+                 for i in range(max(first, 0), min(last, mesh_cnt - 1) + 1)]
+        return [t for t in times if 0. < t < 1.]
+    def _get_piece_param(self, coord, delta, axis):
+        # Return the cell index, position in the cell, and rate of change
+        # of the position in the cell for a line passing through coord
+        tc, idx = self._get_linear_index(coord, axis)
+        if axis == 0:
+            mesh_min, mesh_max = self.mesh_x_min, self.mesh_x_max
+            mesh_dist = self.mesh_x_dist
+        else:
+            mesh_min, mesh_max = self.mesh_y_min, self.mesh_y_max
+            mesh_dist = self.mesh_y_dist
+        if coord < mesh_min or coord > mesh_max:
+            # Position is clamped to the edge of the mesh
+            return idx, tc, 0.
+        return idx, tc, delta / mesh_dist
+    def _find_piece_split(self, x0, y0, dx, dy, piece_start, piece_end,
+                          t_start, z_ref, delta_z):
+        # Within a piece of the line that stays in one mesh cell, Z is a
+        # quadratic of the position along the line.  Find the first
+        # position after t_start where it deviates from z_ref by delta_z.
+        t_mid = .5 * (piece_start + piece_end)
+        xidx, px, ux = self._get_piece_param(x0 + dx * t_mid, dx, 0)
+        yidx, py, uy = self._get_piece_param(y0 + dy * t_mid, dy, 1)
+        # Z within a cell is bounded by the Z of its corners
+        z_min, z_max = self.cell_bounds[yidx][xidx]
+        if z_min > z_ref - delta_z and z_max < z_ref + delta_z:
+            return None
+        z00, zx, zy, zxy = self.cell_coeffs[yidx][xidx]
+        qa = zxy * ux * uy
+        qb = zx * ux + zy * uy + zxy * (px * uy + py * ux)
+        qc = z00 + zx * px + (zy + zxy * px) * py
+        t_start = max(t_start, piece_start)
+        best = None
+        for target in (z_ref - delta_z, z_ref + delta_z):
+            c = qc - target
+            if abs(qa) < 1e-15:
+                if not qb:
+                    continue
+                roots = [-c / qb]
+            else:
+                disc = qb * qb - 4. * qa * c
+                if disc < 0.:
+                    continue
+                sq = math.sqrt(disc)
+                roots = [(-qb - sq) / (2. * qa), (-qb + sq) / (2. * qa)]
+            for r in roots:
+                t = t_mid + r
+                if t_start < t <= piece_end and (best is None or t < best):
+                    best = t
+        return best
+    def find_z_splits(self, start, end, delta_z, min_t=0.):
+        # Return the fractions along the XY line from start to end at which
+        # the Z adjustment has changed by delta_z since the previous split.
+        # Splits are at least min_t apart.
+        if self.mesh_matrix is None or min_t >= 1.:
+            return []
+        x0 = start[0] + self.mesh_offsets[0]
+        y0 = start[1] + self.mesh_offsets[1]
+        dx = end[0] - start[0]
+        dy = end[1] - start[1]
+        min_t = max(min_t, 1e-9)
+        pieces = [0., 1.]
+        pieces.extend(self._get_crossings(x0, dx, 0))
+        pieces.extend(self._get_crossings(y0, dy, 1))
+        pieces.sort()
+        calc_z = self.calc_z
+        z_ref = calc_z(start[0], start[1])
+        splits = []
+        t_start = min_t
+        pidx = 0
+        while t_start < 1.:
+            z = calc_z(start[0] + dx * t_start, start[1] + dy * t_start)
+            if abs(z - z_ref) >= delta_z:
+                t_split = t_start
+            else:
+                t_split = None
+                while pidx < len(pieces) - 1:
+                    piece_start, piece_end = pieces[pidx], pieces[pidx + 1]
+                    if piece_end > t_start:
+                        t_split = self._find_piece_split(
+                            x0, y0, dx, dy, piece_start, piece_end,
+                            t_start, z_ref, delta_z)
+                        if t_split is not None:
+                            break
+                    pidx += 1
+                if t_split is None or t_split >= 1.:
+                    break
+            splits.append(t_split)
+            z_ref = calc_z(start[0] + dx * t_split, start[1] + dy * t_split)
+            t_start = t_split + min_t
+        return splits
+    def calc_z_batch(self, xs, ys):
+        # Calculate the Z adjustment for a sequence of XY points
+        if self.mesh_matrix is None:
+            return [0.] * len(xs)
+        if self.coeff_array is None:
+            return [self.calc_z(x, y) for x, y in zip(xs, ys)]
+        tx, xidx = self._get_linear_indexes(xs, 0)
+        ty, yidx = self._get_linear_indexes(ys, 1)
+        coeffs = self.coeff_array[yidx, xidx]
+        z = (coeffs[:, 0] + coeffs[:, 1] * tx
+             + (coeffs[:, 2] + coeffs[:, 3] * tx) * ty)
+        return z.tolist()
     def get_z_range(self):
         if self.mesh_matrix is not None:
             mesh_min = min([min(x) for x in self.mesh_matrix])
@@ -1458,18 +1646,32 @@ class ZMesh:
             mesh_min = self.mesh_x_min
             mesh_cnt = self.mesh_x_count
             mesh_dist = self.mesh_x_dist
-            cfunc = self.get_x_coordinate
         else:
             # Y-axis
             mesh_min = self.mesh_y_min
             mesh_cnt = self.mesh_y_count
             mesh_dist = self.mesh_y_dist
-            cfunc = self.get_y_coordinate
-        t = 0.
-        idx = int(math.floor((coord - mesh_min) / mesh_dist))
-        idx = constrain(idx, 0, mesh_cnt - 2)
-        t = (coord - cfunc(idx)) / mesh_dist
-        return constrain(t, 0., 1.), idx
+        pos = (coord - mesh_min) / mesh_dist
+        idx = int(math.floor(pos))
+        if idx < 0:
+            return 0., 0
+        if idx > mesh_cnt - 2:
+            return 1., mesh_cnt - 2
+        return pos - idx, idx
+    def _get_linear_indexes(self, coords, axis):
+        # Array version of _get_linear_index()
+        if axis == 0:
+            mesh_min = self.mesh_x_min
+            mesh_cnt = self.mesh_x_count
+            mesh_dist = self.mesh_x_dist
+        else:
+            mesh_min = self.mesh_y_min
+            mesh_cnt = self.mesh_y_count
+            mesh_dist = self.mesh_y_dist
+        coords = numpy.asarray(coords, dtype=float) + self.mesh_offsets[axis]
+        pos = (coords - mesh_min) / mesh_dist
+        idx = numpy.clip(numpy.floor(pos), 0, mesh_cnt - 2).astype(int)
+        return numpy.clip(pos - idx, 0., 1.), idx
     def _sample_direct(self, z_matrix):
         self.mesh_matrix = z_matrix
     def _sample_lagrange(self, z_matrix):
@@ -1622,6 +1824,69 @@ class ZMesh:
         c = m1 * (t3 - 2*t2 + t)
         d = m2 * (t3 - t2)
         return a + b + c + d
+    # NumPy based interpolation.  Both algorithms interpolate the probed
+    # rows along X and then every column along Y, which is equivalent
+    # to multiplying the probed matrix by a weight matrix for each axis.
+    def _sample_weights(self, z_matrix, x_weights, y_weights):
+        z = numpy.array(z_matrix, dtype=float)
+        self.mesh_matrix = y_weights.dot(z).dot(x_weights.T).tolist()
+    def _set_probed_weights(self, weights, mult):
+        # Probed points are copied directly
+        nodes = numpy.arange(0, weights.shape[0], mult)
+        weights[nodes] = 0.
+        weights[nodes, nodes // mult] = 1.
+        return weights
+    def _lagrange_weights(self, lpts, coords, mult):
+        lpts = numpy.array(lpts)
+        coords = numpy.array(coords)
+        pt_cnt = len(lpts)
+        weights = numpy.empty((len(coords), pt_cnt))
+        for i in range(pt_cnt):
+            others = numpy.delete(lpts, i)
+            n = numpy.prod(coords[:, None] - others[None, :], axis=1)
+            d = numpy.prod(lpts[i] - others)
+            weights[:, i] = n / d
+        return self._set_probed_weights(weights, mult)
+    def _sample_lagrange_numpy(self, z_matrix):
+        xpts, ypts = self._get_lagrange_coords()
+        xcoords = [self.get_x_coordinate(i) for i in range(self.mesh_x_count)]
+        ycoords = [self.get_y_coordinate(j) for j in range(self.mesh_y_count)]
+        x_weights = self._lagrange_weights(xpts, xcoords, self.x_mult)
+        y_weights = self._lagrange_weights(ypts, ycoords, self.y_mult)
+        self._sample_weights(z_matrix, x_weights, y_weights)
+    def _bicubic_weights(self, mesh_cnt, pt_cnt, mult, tension):
+        # Cardinal spline weights of the 4 control points for each point
+        idx = numpy.arange(mesh_cnt)
+        seg = numpy.minimum(idx // mult, pt_cnt - 2)
+        t = (idx - seg * mult) / float(mult)
+        t2 = t*t
+        t3 = t2*t
+        h00 = 2*t3 - 3*t2 + 1
+        h01 = -2*t3 + 3*t2
+        h10 = tension * (t3 - 2*t2 + t)
+        h11 = tension * (t3 - t2)
+        weights = numpy.zeros((mesh_cnt, pt_cnt))
+        numpy.add.at(weights, (idx, numpy.maximum(seg - 1, 0)), -h10)
+        numpy.add.at(weights, (idx, seg), h00 - h11)
+        numpy.add.at(weights, (idx, seg + 1), h01 + h10)
+        numpy.add.at(weights, (idx, numpy.minimum(seg + 2, pt_cnt - 1)), h11)
+        return self._set_probed_weights(weights, mult)
+    def _sample_bicubic_numpy(self, z_matrix):
+        c = self.mesh_params['tension']
+        x_weights = self._bicubic_weights(
+            self.mesh_x_count, self.mesh_params['x_count'], self.x_mult, c)
+        y_weights = self._bicubic_weights(
+            self.mesh_y_count, self.mesh_params['y_count'], self.y_mult, c)
+        self._sample_weights(z_matrix, x_weights, y_weights)
+
+
+# Run in a background process to interpolate a mesh
+def _interpolate_mesh(z_mesh, z_matrix):
+    try:
+        z_mesh._sample(z_matrix)
+    except BedMeshError as e:
+        return str(e), None
+    return None, z_mesh.mesh_matrix
 
 
 class ProfileManager:
@@ -1632,6 +1897,8 @@ class ProfileManager:
         self.bedmesh = bedmesh
         self.profiles = {}
         self.incompatible_profiles = []
+        self.profile_format = config.getchoice(
+            'profile_format', PROFILE_FORMATS, 'text')
         # Fetch stored profiles from Config
         stored_profs = config.get_prefix_sections(self.name)
         stored_profs = [s for s in stored_profs
@@ -1647,8 +1914,6 @@ class ProfileManager:
                 self.incompatible_profiles.append(name)
                 continue
             self.profiles[name] = {}
-            zvals = profile.getlists('points', seps=(',', '\n'), parser=float)
-            self.profiles[name]['points'] = zvals
             self.profiles[name]['mesh_params'] = params = \
                 collections.OrderedDict()
             for key, t in PROFILE_OPTIONS.items():
@@ -1658,6 +1923,19 @@ class ProfileManager:
                     params[key] = profile.getfloat(key)
                 elif t is str:
                     params[key] = profile.get(key)
+            packed = profile.get('points_packed', None)
+            if packed is None:
+                zvals = profile.getlists('points', seps=(',', '\n'),
+                                         parser=float)
+            else:
+                crc = profile.getint('points_crc')
+                try:
+                    zvals = unpack_points(packed, crc, params['x_count'],
+                                          params['y_count'])
+                except BedMeshError as e:
+                    raise config.error(
+                        "bed_mesh: Profile [%s]: %s" % (name, str(e)))
+            self.profiles[name]['points'] = zvals
         # Register GCode
         self.gcode.register_command(
             'BED_MESH_PROFILE', self.cmd_BED_MESH_PROFILE,
@@ -1687,14 +1965,21 @@ class ProfileManager:
         configfile = self.printer.lookup_object('configfile')
         cfg_name = self.name + " " + prof_name
         # set params
-        z_values = ""
-        for line in probed_matrix:
-            z_values += "\n  "
-            for p in line:
-                z_values += "%.6f, " % p
-            z_values = z_values[:-2]
+        # remove any previous profile as it may be in the other format
+        configfile.remove_section(cfg_name)
         configfile.set(cfg_name, 'version', PROFILE_VERSION)
-        configfile.set(cfg_name, 'points', z_values)
+        if self.profile_format == 'compact':
+            packed, crc = pack_points(probed_matrix)
+            configfile.set(cfg_name, 'points_packed', packed)
+            configfile.set(cfg_name, 'points_crc', crc)
+        else:
+            z_values = ""
+            for line in probed_matrix:
+                z_values += "\n  "
+                for p in line:
+                    z_values += "%.6f, " % p
+                z_values = z_values[:-2]
+            configfile.set(cfg_name, 'points', z_values)
         for key, value in mesh_params.items():
             configfile.set(cfg_name, key, value)
         # save copy in local storage
@@ -1717,11 +2002,8 @@ class ProfileManager:
                 "bed_mesh: Unknown profile [%s]" % prof_name)
         probed_matrix = profile['points']
         mesh_params = profile['mesh_params']
-        z_mesh = ZMesh(mesh_params, prof_name)
-        try:
-            z_mesh.build_mesh(probed_matrix)
-        except BedMeshError as e:
-            raise self.gcode.error(str(e))
+        z_mesh = self.bedmesh.build_mesh(mesh_params, prof_name,
+                                         probed_matrix)
         self.bedmesh.set_mesh(z_mesh)
     def remove_profile(self, prof_name):
         if prof_name in self.profiles:
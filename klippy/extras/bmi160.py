@@ -51,6 +51,7 @@ class BMI160:
         self.reactor = self.printer.get_reactor()
         adxl345.AccelCommandHelper(config, self)
         self.axes_map = adxl345.read_axes_map(config, SCALE, SCALE, SCALE)
+        self.accel_conv = adxl345.AccelConverter(self.axes_map)
         self.data_rate = 1600
         # Setup mcu sensor_bmi160 bulk query code
         # Check for SPI or I2C
@@ -118,17 +119,9 @@ class BMI160:
         aqh = adxl345.AccelQueryHelper(self.printer)
         self.batch_bulk.add_client(aqh.handle_batch)
         return aqh
-    def _convert_samples(self, samples):
-        (x_pos, x_scale), (y_pos, y_scale), (z_pos, z_scale) = self.axes_map
-        count = 0
-        for ptime, rx, ry, rz in samples:
-            raw_xyz = (rx, ry, rz)
-            x = round(raw_xyz[x_pos] * x_scale, 6)
-            y = round(raw_xyz[y_pos] * y_scale, 6)
-            z = round(raw_xyz[z_pos] * z_scale, 6)
-            samples[count] = (round(ptime, 6), x, y, z)
-            count += 1
-        del samples[count:]
+    def _convert_samples(self, columns):
+        times, rx, ry, rz = columns
+        return self.accel_conv.convert(times, (rx, ry, rz))
     def _start_measurements(self):
         # 1. Force SPI Mode (Dummy Read)
         if self.bus_type == 'spi':
@@ -174,8 +167,8 @@ class BMI160:
         self.ffreader.note_end()
         logging.info("BMI160 finished '%s' measurements", self.name)
     def _process_batch(self, eventtime):
-        samples = self.ffreader.pull_samples()
-        self._convert_samples(samples)
+        columns = self.ffreader.pull_sample_columns()
+        samples = self._convert_samples(columns)
         if not samples:
             return {}
         return {'data': samples, 'errors': self.last_error_count,
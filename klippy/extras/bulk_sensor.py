@@ -120,18 +120,22 @@ class BulkDataQueue:
         # Measurement storage (accessed from background thread)
         self.lock = threading.Lock()
         self.raw_samples = []
-        # Register callback with mcu
-        mcu.register_serial_response(self._handle_data, msg_fmt, oid)
-    def _handle_data(self, params):
+        # Register callback with mcu (messages are queued undecoded and
+        # are only decoded when pulled from the queue)
+        self.response = mcu.register_serial_response(
+            self._handle_data, msg_fmt, oid, is_raw=True)
+    def _handle_data(self, data, receive_time):
         with self.lock:
-            self.raw_samples.append(params)
+            self.raw_samples.append(data)
     def pull_queue(self):
         with self.lock:
             raw_samples = self.raw_samples
             self.raw_samples = []
-        return raw_samples
+        parse_raw = self.response.parse_raw
+        return [parse_raw(data) for data in raw_samples]
     def clear_queue(self):
-        self.pull_queue()
+        with self.lock:
+            self.raw_samples = []
 
 
 ######################################################################
@@ -208,10 +212,13 @@ class FixedFreqReader:
     def __init__(self, mcu, chip_clock_smooth, unpack_fmt):
         self.mcu = mcu
         self.clock_sync = ClockSyncRegression(mcu, chip_clock_smooth)
+        self.unpack_fmt = unpack_fmt
         unpack = struct.Struct(unpack_fmt)
         self.unpack_from = unpack.unpack_from
         self.bytes_per_sample = unpack.size
         self.samples_per_block = MAX_BULK_MSG_SIZE // self.bytes_per_sample
+        self.fields_per_sample = len(unpack.unpack(b'\x00' * unpack.size))
+        self.block_unpacks = {}
         self.last_sequence = self.max_query_duration = 0
         self.last_overflows = 0
         self.bulk_queue = self.oid = self.query_status_cmd = None
@@ -266,34 +273,64 @@ class FixedFreqReader:
             self.clock_sync.reset(avg_mcu_clock, chip_clock)
         else:
             self.clock_sync.update(avg_mcu_clock, chip_clock)
-    # Convert sensor_bulk_data responses into list of samples
-    def pull_samples(self):
+    def _lookup_block_unpack(self, count):
+        # Return a function that unpacks 'count' samples in one call
+        unpack = self.block_unpacks.get(count)
+        if unpack is not None:
+            return unpack
+        fmt = self.unpack_fmt
+        prefix = ""
+        if fmt[:1] in "@=<>!":
+            prefix, fmt = fmt[:1], fmt[1:]
+        block = struct.Struct(prefix + fmt * count)
+        if block.size == count * self.bytes_per_sample:
+            unpack = block.unpack_from
+        else:
+            # Native alignment padding - unpack each sample separately
+            unpack_from = self.unpack_from
+            bps = self.bytes_per_sample
+            def unpack(data):
+                return sum([unpack_from(data, i * bps)
+                            for i in range(count)], ())
+        self.block_unpacks[count] = unpack
+        return unpack
+    # Convert sensor_bulk_data responses into a list of columns (the
+    # first column contains sample times and each remaining column
+    # contains one field of the unpack format)
+    def pull_sample_columns(self):
         # Query MCU for sample timing and update clock synchronization
         self._update_clock()
         # Pull sensor_bulk_data messages from local queue
         raw_samples = self.bulk_queue.pull_queue()
+        nfields = self.fields_per_sample
+        columns = [[] for i in range(nfields + 1)]
         if not raw_samples:
-            return []
+            return columns
         # Load variables to optimize inner loop below
         last_sequence = self.last_sequence
         time_base, chip_base, inv_freq = self.clock_sync.get_time_translation()
-        unpack_from = self.unpack_from
         bytes_per_sample = self.bytes_per_sample
         samples_per_block = self.samples_per_block
+        times = columns[0]
+        fields = list(enumerate(columns[1:]))
         # Process every message in raw_samples
-        count = seq = 0
-        samples = [None] * (len(raw_samples) * samples_per_block)
+        seq = count = 0
         for params in raw_samples:
             seq_diff = (params['sequence'] - last_sequence) & 0xffff
             seq_diff -= (seq_diff & 0x8000) << 1
             seq = last_sequence + seq_diff
             msg_cdiff = seq * samples_per_block - chip_base
             data = params['data']
-            for i in range(len(data) // bytes_per_sample):
-                ptime = time_base + (msg_cdiff + i) * inv_freq
-                udata = unpack_from(data, i * bytes_per_sample)
-                samples[count] = (ptime,) + udata
-                count += 1
-        self.clock_sync.set_last_chip_clock(seq * samples_per_block + i)
-        del samples[count:]
-        return samples
+            count = len(data) // bytes_per_sample
+            if not count:
+                continue
+            udata = self._lookup_block_unpack(count)(data)
+            times.extend([time_base + (msg_cdiff + i) * inv_freq
+                          for i in range(count)])
+            for i, column in fields:
+                column.extend(udata[i::nfields])
+        self.clock_sync.set_last_chip_clock(seq * samples_per_block + count - 1)
+        return columns
+    # Convert sensor_bulk_data responses into list of samples
+    def pull_samples(self):
+        return list(zip(*self.pull_sample_columns()))
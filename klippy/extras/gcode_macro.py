@@ -3,7 +3,7 @@
 # Copyright (C) 2018-2021  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import traceback, logging, ast, copy, json
+import os, traceback, logging, ast, copy, json
 import jinja2
 
 
@@ -11,6 +11,59 @@ import jinja2
 # Template handling
 ######################################################################
 
+# Copy a get_status() container (tuples are assumed to be immutable)
+def _copy_status(val):
+    if type(val) is dict:
+        return StatusDict(val)
+    if type(val) is list:
+        return [_copy_status(v) for v in val]
+    if isinstance(val, (dict, list, set)):
+        return copy.deepcopy(val)
+    return val
+
+# Copy of a get_status() dict.  Nested containers are only copied when
+# accessed, so that a template can not alter the printer object's state.
+class StatusDict(dict):
+    def __getitem__(self, key):
+        val = dict.__getitem__(self, key)
+        if isinstance(val, (dict, list, set)) and type(val) is not StatusDict:
+            val = _copy_status(val)
+            dict.__setitem__(self, key, val)
+        return val
+    def __iter__(self):
+        # Defining __iter__ also makes dict(), update(), and similar use
+        # __getitem__ instead of reading the stored values directly
+        return iter(dict.keys(self))
+    def _copy_all(self):
+        for key in list(dict.keys(self)):
+            self.__getitem__(key)
+    def get(self, key, default=None):
+        if key in self:
+            return self.__getitem__(key)
+        return default
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self.__getitem__(key)
+        return dict.setdefault(self, key, default)
+    def values(self):
+        self._copy_all()
+        return dict.values(self)
+    def items(self):
+        self._copy_all()
+        return dict.items(self)
+    def pop(self, key, *args):
+        if key in self:
+            self.__getitem__(key)
+        return dict.pop(self, key, *args)
+    def popitem(self):
+        self._copy_all()
+        return dict.popitem(self)
+    def copy(self):
+        self._copy_all()
+        return StatusDict(self)
+    def __deepcopy__(self, memo):
+        return copy.deepcopy(dict(self.items()), memo)
+
 # Wrapper for access to printer object get_status() methods
 class GetStatusWrapper:
     def __init__(self, printer, eventtime=None):
@@ -29,7 +82,7 @@ class GetStatusWrapper:
             self.eventtime = reactor.monotonic()
         with reactor.assert_no_pause():
             sts = po.get_status(self.eventtime)
-        self.cache[sval] = res = copy.deepcopy(sts)
+        self.cache[sval] = res = _copy_status(sts)
         return res
     def __contains__(self, val):
         try:
@@ -51,7 +104,7 @@ class TemplateWrapper:
         gcode_macro = self.printer.lookup_object('gcode_macro')
         self.create_template_context = gcode_macro.create_template_context
         try:
-            self.template = env.from_string(script)
+            self.template = gcode_macro.compile_template(env, name, script)
         except jinja2.exceptions.TemplateSyntaxError as e:
             lines = script.splitlines()
             msg = "Error loading template '%s'\nline %s: %s # %s" % (
@@ -81,6 +134,32 @@ class PrinterGCodeMacro:
     def __init__(self, config):
         self.printer = config.get_printer()
         self.env = jinja2.Environment('{%', '%}', '{', '}')
+        # Reuse compiled templates across restarts if a config cache is used
+        self.bytecode_cache = None
+        cache_fname = self.printer.get_start_args().get('config_cache')
+        if cache_fname is not None:
+            cache_dir = cache_fname + '.templates'
+            try:
+                if not os.path.isdir(cache_dir):
+                    os.makedirs(cache_dir)
+                self.bytecode_cache = jinja2.FileSystemBytecodeCache(cache_dir)
+            except OSError:
+                logging.exception("Unable to create template cache '%s'",
+                                  cache_dir)
+    def compile_template(self, env, name, script):
+        bcc = self.bytecode_cache
+        if bcc is None or env is not self.env:
+            return env.from_string(script)
+        bucket = bcc.get_bucket(env, name, None, script)
+        if bucket.code is None:
+            bucket.code = env.compile(script, name)
+            try:
+                bcc.set_bucket(bucket)
+            except (IOError, OSError):
+                logging.exception("Unable to write template cache for '%s'",
+                                  name)
+        return env.template_class.from_code(env, bucket.code,
+                                            env.make_globals(None))
     def load_template(self, config, option, default=None):
         name = "%s:%s" % (config.get_name(), option)
         if default is None:
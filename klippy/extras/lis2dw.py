@@ -59,6 +59,7 @@ class LIS2DW:
             self.axes_map = adxl345.read_axes_map(config, LIS3DH_SCALE,
                             LIS3DH_SCALE, LIS3DH_SCALE)
             self.data_rate = 1344
+        self.accel_conv = adxl345.AccelConverter(self.axes_map)
         # Check for spi or i2c
         if config.get('cs_pin', None) is not None:
             self.bus_type = SPI_SERIAL_TYPE
@@ -122,16 +123,9 @@ class LIS2DW:
         self.batch_bulk.add_client(aqh.handle_batch)
         return aqh
     # Measurement decoding
-    def _convert_samples(self, samples):
-        (x_pos, x_scale), (y_pos, y_scale), (z_pos, z_scale) = self.axes_map
-        count = 0
-        for ptime, rx, ry, rz in samples:
-            raw_xyz = (rx, ry, rz)
-            x = round(raw_xyz[x_pos] * x_scale, 6)
-            y = round(raw_xyz[y_pos] * y_scale, 6)
-            z = round(raw_xyz[z_pos] * z_scale, 6)
-            samples[count] = (round(ptime, 6), x, y, z)
-            count += 1
+    def _convert_samples(self, columns):
+        times, rx, ry, rz = columns
+        return self.accel_conv.convert(times, (rx, ry, rz))
     # Start, stop, and process message batches
     def _start_measurements(self):
         # In case of miswiring, testing LIS2DW device ID prevents treating
@@ -195,8 +189,8 @@ class LIS2DW:
         logging.info("LIS2DW finished '%s' measurements", self.name)
         self.set_reg(REG_LIS2DW_FIFO_CTRL, 0x00)
     def _process_batch(self, eventtime):
-        samples = self.ffreader.pull_samples()
-        self._convert_samples(samples)
+        columns = self.ffreader.pull_sample_columns()
+        samples = self._convert_samples(columns)
         if not samples:
             return {}
         return {'data': samples, 'errors': self.last_error_count,
@@ -30,6 +30,8 @@ class ManualStepper:
         self.motion_queuing = self.printer.load_object(config, 'motion_queuing')
         self.trapq = self.motion_queuing.allocate_trapq()
         self.trapq_append = self.motion_queuing.lookup_trapq_append()
+        self.trapq_append_batch = (
+            self.motion_queuing.lookup_trapq_append_batch())
         self.rail.setup_itersolve('cartesian_stepper_alloc', b'x')
         self.rail.set_trapq(self.trapq)
         # Registered with toolhead as an axtra axis
@@ -165,18 +167,24 @@ class ManualStepper:
         self.gaxis_limit_velocity = limit_velocity
         self.gaxis_limit_accel = limit_accel
         toolhead.add_extra_axis(self, self.commanded_pos)
-    def process_move(self, print_time, move, ea_index):
-        axis_r = move.axes_r[ea_index]
-        start_pos = move.start_pos[ea_index]
-        accel = move.accel * axis_r
-        start_v = move.start_v * axis_r
-        cruise_v = move.cruise_v * axis_r
-        self.trapq_append(self.trapq, print_time,
-                          move.accel_t, move.cruise_t, move.decel_t,
-                          start_pos, 0., 0.,
-                          1., 0., 0.,
-                          start_v, cruise_v, accel)
-        self.commanded_pos = move.end_pos[ea_index]
+    def process_moves(self, print_time, moves, ea_index):
+        moves_data = []
+        last_move = None
+        for move in moves:
+            if move.axes_d[ea_index]:
+                axis_r = move.axes_r[ea_index]
+                moves_data.extend((
+                    print_time, move.accel_t, move.cruise_t, move.decel_t,
+                    move.start_pos[ea_index], 0., 0.,
+                    1., 0., 0.,
+                    move.start_v * axis_r, move.cruise_v * axis_r,
+                    move.accel * axis_r))
+                last_move = move
+            print_time = (print_time + move.accel_t
+                          + move.cruise_t + move.decel_t)
+        if last_move is not None:
+            self.trapq_append_batch(self.trapq, moves_data)
+            self.commanded_pos = last_move.end_pos[ea_index]
     def check_move(self, move, ea_index):
         # Check move is in bounds
         movepos = move.end_pos[ea_index]
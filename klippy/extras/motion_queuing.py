@@ -70,6 +70,23 @@ class PrinterMotionQueuing:
     def lookup_trapq_append(self):
         ffi_main, ffi_lib = chelper.get_ffi()
         return ffi_lib.trapq_append
+    def lookup_trapq_append_batch(self):
+        # Returns a function that adds several moves to a trapq using a
+        # single call into the C code.  The moves are passed as a flat
+        # list containing the trapq_append() parameters (starting with
+        # print_time) of each move.
+        ffi_main, ffi_lib = chelper.get_ffi()
+        trapq_append_batch = ffi_lib.trapq_append_batch
+        move_size = (ffi_main.sizeof("struct trapq_append_move")
+                     // ffi_main.sizeof("double"))
+        def append_batch(trapq, moves_data):
+            count = len(moves_data) // move_size
+            if not count:
+                return
+            data = ffi_main.new("double[]", moves_data)
+            trapq_append_batch(trapq, ffi_main.cast(
+                "struct trapq_append_move *", data), count)
+        return append_batch
     # C steppersync tracking
     def _lookup_steppersync(self, mcu):
         for ss_mcu, ss in self.steppersyncs:
@@ -3,7 +3,7 @@
 # Copyright (C) 2021  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import logging
+import logging, struct
 import chelper
 from . import bulk_sensor
 
@@ -69,6 +69,11 @@ class DumpStepper:
 
 NEVER_TIME = 9999999999999999.
 
+# Number of moves extracted per trapq_extract_old() call
+PULL_MOVE_COUNT = 128
+# Number of double fields in a 'struct pull_move'
+PULL_MOVE_FIELDS = 10
+
 # Extract trapezoidal motion queue (trapq)
 class DumpTrapQ:
     def __init__(self, printer, name, trapq):
@@ -77,6 +82,12 @@ class DumpTrapQ:
         self.trapq = trapq
         self.last_batch_msg = (0., 0.)
         self.motion_queuing = printer.lookup_object("motion_queuing")
+        # Extraction buffers are reused between batches
+        ffi_main, ffi_lib = chelper.get_ffi()
+        self.pull_moves = ffi_main.new('struct pull_move[%d]'
+                                       % (PULL_MOVE_COUNT,))
+        self.pull_moves_buf = ffi_main.buffer(self.pull_moves)
+        self.pull_position = ffi_main.new('struct pull_move[1]')
         self.batch_bulk = bulk_sensor.BatchBulkHelper(printer,
                                                       self._process_batch)
         api_resp = {'header': ('time', 'duration', 'start_velocity',
@@ -98,6 +109,35 @@ class DumpTrapQ:
             end_time = data[count-1].print_time
         res.reverse()
         return ([d[i] for d, cnt in res for i in range(cnt-1, -1, -1)], res)
+    def extract_trapq_columns(self, start_time, end_time):
+        # Return a list of columns (one per pull_move field) with the
+        # moves in time order
+        ffi_main, ffi_lib = chelper.get_ffi()
+        pull_moves = self.pull_moves
+        nf = PULL_MOVE_FIELDS
+        res = []
+        while 1:
+            count = ffi_lib.trapq_extract_old(self.trapq, pull_moves,
+                                              PULL_MOVE_COUNT,
+                                              start_time, end_time)
+            if not count:
+                break
+            # Convert all extracted moves in one call (the buffer is
+            # overwritten on the next extraction)
+            vals = struct.unpack_from('=%dd' % (count * nf,),
+                                      self.pull_moves_buf)
+            res.append(vals)
+            if count < PULL_MOVE_COUNT:
+                break
+            end_time = vals[(count - 1) * nf]
+        res.reverse()
+        columns = [[] for i in range(nf)]
+        for vals in res:
+            # Moves are extracted newest first
+            last = len(vals) - nf
+            for i, col in enumerate(columns):
+                col.extend(vals[last + i::-nf])
+        return columns
     def log_trapq(self, data):
         if not data:
             return
@@ -110,7 +150,7 @@ class DumpTrapQ:
         logging.info('\n'.join(out))
     def get_trapq_position(self, print_time):
         ffi_main, ffi_lib = chelper.get_ffi()
-        data = ffi_main.new('struct pull_move[1]')
+        data = self.pull_position
         count = ffi_lib.trapq_extract_old(self.trapq, data, 1, 0., print_time)
         if not count:
             return None, None
@@ -123,10 +163,9 @@ class DumpTrapQ:
         return pos, velocity
     def _process_batch(self, eventtime):
         qtime = self.last_batch_msg[0] + min(self.last_batch_msg[1], 0.100)
-        data, cdata = self.extract_trapq(qtime, NEVER_TIME)
-        d = [(m.print_time, m.move_t, m.start_v, m.accel,
-              (m.start_x, m.start_y, m.start_z), (m.x_r, m.y_r, m.z_r))
-             for m in data]
+        c = self.extract_trapq_columns(qtime, NEVER_TIME)
+        d = list(zip(c[0], c[1], c[2], c[3], zip(c[4], c[5], c[6]),
+                     zip(c[7], c[8], c[9])))
         if d:
             start_drip_time = self.motion_queuing.check_drip_timing()
             if start_drip_time is not None:
@@ -60,6 +60,7 @@ class MPU9250:
         self.printer = config.get_printer()
         adxl345.AccelCommandHelper(config, self)
         self.axes_map = adxl345.read_axes_map(config, SCALE, SCALE, SCALE)
+        self.accel_conv = adxl345.AccelConverter(self.axes_map)
         self.data_rate = config.getint('rate', 4000)
         if self.data_rate not in SAMPLE_RATE_DIVS:
             raise config.error("Invalid rate parameter: %d" % (self.data_rate,))
@@ -103,16 +104,9 @@ class MPU9250:
         self.batch_bulk.add_client(aqh.handle_batch)
         return aqh
     # Measurement decoding
-    def _convert_samples(self, samples):
-        (x_pos, x_scale), (y_pos, y_scale), (z_pos, z_scale) = self.axes_map
-        count = 0
-        for ptime, rx, ry, rz in samples:
-            raw_xyz = (rx, ry, rz)
-            x = round(raw_xyz[x_pos] * x_scale, 6)
-            y = round(raw_xyz[y_pos] * y_scale, 6)
-            z = round(raw_xyz[z_pos] * z_scale, 6)
-            samples[count] = (round(ptime, 6), x, y, z)
-            count += 1
+    def _convert_samples(self, columns):
+        times, rx, ry, rz = columns
+        return self.accel_conv.convert(times, (rx, ry, rz))
     # Start, stop, and process message batches
     def _start_measurements(self):
         # In case of miswiring, testing MPU9250 device ID prevents treating
@@ -161,8 +155,8 @@ class MPU9250:
         self.set_reg(REG_PWR_MGMT_1, SET_PWR_MGMT_1_SLEEP)
         self.set_reg(REG_PWR_MGMT_2, SET_PWR_MGMT_2_OFF)
     def _process_batch(self, eventtime):
-        samples = self.ffreader.pull_samples()
-        self._convert_samples(samples)
+        columns = self.ffreader.pull_sample_columns()
+        samples = self._convert_samples(columns)
         if not samples:
             return {}
         return {'data': samples, 'errors': self.last_error_count,
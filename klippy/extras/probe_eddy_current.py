@@ -282,12 +282,16 @@ class EddyCalibration:
 
 # Tool to gather samples and convert them to probe positions
 class EddyGatherSamples:
-    def __init__(self, printer, sensor_helper):
+    def __init__(self, printer, sensor_helper, streaming=False):
         self._printer = printer
         self._sensor_helper = sensor_helper
         # Sensor reading
         self._sensor_messages = []
         self._need_stop = False
+        # In streaming mode measurements are accumulated into running
+        # totals as they arrive and sensor messages are not retained.
+        # This requires each request to be added before its start_time.
+        self._streaming = streaming
         # Probe request and results storage
         self._probe_requests = []
         self._analysis_results = []
@@ -298,6 +302,9 @@ class EddyGatherSamples:
         if self._need_stop:
             del self._sensor_messages[:]
             return False
+        if self._streaming:
+            self._stream_sensor_message(msg)
+            return True
         self._sensor_messages.append(msg)
         self._check_sensor_messages()
         return True
@@ -331,16 +338,54 @@ class EddyGatherSamples:
             if self._sensor_messages[-1]['data'][-1][0] < end_time:
                 break
             measures = self._pull_measurements(start_time, end_time)
-            errmsg = res = None
-            try:
-                # Call analysis callback to process measurements
-                res = cb(measures, *args)
-            except self._printer.command_error as e:
-                # Defer raising of errors to pull_probed()
-                errmsg = str(e)
-            self._analysis_results.append((res, errmsg))
+            self._report_analysis(cb, (measures,) + args)
             self._probe_requests.pop(0)
+    def _stream_sensor_message(self, msg):
+        # Accumulate measurements into pending requests
+        data = msg['data']
+        first_time = data[0][0]
+        last_time = data[-1][0]
+        for req in self._probe_requests:
+            cb, start_time, end_time, args, totals = req
+            if start_time > last_time:
+                break
+            if end_time < first_time:
+                continue
+            count, freq_sum = totals
+            for measure in data:
+                time = measure[0]
+                if time < start_time:
+                    continue
+                if time > end_time:
+                    break
+                count += 1
+                freq_sum += measure[1]
+            totals[0] = count
+            totals[1] = freq_sum
+        # Report requests that are now complete
+        while self._probe_requests:
+            cb, start_time, end_time, args, totals = self._probe_requests[0]
+            if last_time < end_time:
+                break
+            self._report_analysis(cb, tuple(totals) + args)
+            self._probe_requests.pop(0)
+    def _report_analysis(self, cb, args):
+        errmsg = res = None
+        try:
+            # Call analysis callback to process measurements
+            res = cb(*args)
+        except self._printer.command_error as e:
+            # Defer raising of errors to pull_probed()
+            errmsg = str(e)
+        self._analysis_results.append((res, errmsg))
     def add_probe_request(self, cb, start_time, end_time, *args):
+        # In streaming mode 'cb' is called with (count, freq_sum, *args),
+        # otherwise it is called with (measures, *args)
+        if self._streaming:
+            totals = [0, 0.]
+            self._probe_requests.append((cb, start_time, end_time, args,
+                                         totals))
+            return
         self._probe_requests.append((cb, start_time, end_time, args))
         self._check_sensor_messages()
     # Extract probe results
@@ -349,7 +394,7 @@ class EddyGatherSamples:
         reactor = self._printer.get_reactor()
         mcu = self._sensor_helper.get_mcu()
         while self._probe_requests:
-            cb, start_time, end_time, args = self._probe_requests[0]
+            end_time = self._probe_requests[0][2]
             systime = reactor.monotonic()
             est_print_time = mcu.estimated_print_time(systime)
             if est_print_time > end_time + 1.0:
@@ -379,7 +424,16 @@ def probe_results_from_avg(measures, toolhead_pos, calibration, offsets):
         raise cmderr("Unable to obtain probe_eddy_current sensor readings")
     # Determine average of measurements
     freq_sum = sum([m[1] for m in measures])
-    freq_avg = freq_sum / len(measures)
+    return probe_results_from_sum(len(measures), freq_sum, toolhead_pos,
+                                  calibration, offsets)
+
+# Generate a ProbeResult from an accumulated sum of frequency measurements
+def probe_results_from_sum(count, freq_sum, toolhead_pos, calibration,
+                           offsets):
+    cmderr = calibration.get_printer().command_error
+    if not count:
+        raise cmderr("Unable to obtain probe_eddy_current sensor readings")
+    freq_avg = freq_sum / count
     # Determine height associated with frequency
     sensor_z = calibration.freq_to_height(freq_avg)
     if sensor_z <= -OUT_OF_RANGE or sensor_z >= OUT_OF_RANGE:
@@ -624,9 +678,9 @@ class EddyScanningProbe:
                                       s.get_past_mcu_position(pos_time))
                     for s in kin.get_steppers()}
         return kin.calc_position(kin_spos)
-    def _analyze_scan(self, measures, pos_time):
+    def _analyze_scan(self, count, freq_sum, pos_time):
         toolhead_pos = self._lookup_toolhead_pos(pos_time)
-        return probe_results_from_avg(measures, toolhead_pos,
+        return probe_results_from_sum(count, freq_sum, toolhead_pos,
                                       self._calibration, self._offsets)
     def _rapid_lookahead_cb(self, printtime):
         start_time = printtime - self._sample_time / 2
@@ -636,7 +690,10 @@ class EddyScanningProbe:
     # Probe session interface
     def start_probe_session(self, gcmd):
         self._calibration.verify_calibrated()
-        self._gather = EddyGatherSamples(self._printer, self._sensor_helper)
+        # Scan requests are always added ahead of their sample window,
+        # so measurements can be accumulated as they arrive
+        self._gather = EddyGatherSamples(self._printer, self._sensor_helper,
+                                         streaming=True)
         self._sample_time = gcmd.get_float("SAMPLE_TIME", 0.100, above=0.0)
         self._is_rapid = gcmd.get("METHOD", "scan") == 'rapid_scan'
         return self
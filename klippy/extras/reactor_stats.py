@@ -0,0 +1,42 @@
+# Report reactor callback run times and dispatch latency
+#
+# Copyright (C) 2026  agent <agent@local>
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+
+class PrinterReactorStats:
+    def __init__(self, config):
+        self.printer = config.get_printer()
+        self.report_count = config.getint('report_count', 3, minval=0)
+        self.reactor_stats = self.printer.get_reactor().enable_stats()
+        self.last_totals = {}
+        # Register webhooks
+        webhooks = self.printer.lookup_object('webhooks')
+        webhooks.register_endpoint("reactor_stats/dump_stats",
+                                   self._handle_dump_stats)
+    def _handle_dump_stats(self, web_request):
+        web_request.send(self.reactor_stats.get_status())
+    def stats(self, eventtime):
+        # Report the callbacks with the most run time since the last report
+        rstats = self.reactor_stats
+        last_totals = self.last_totals
+        deltas = []
+        for name, cs in rstats.callbacks.items():
+            total_time = cs[1]
+            delta = total_time - last_totals.get(name, 0.)
+            if delta > 0.:
+                deltas.append((delta, name, cs[2]))
+            last_totals[name] = total_time
+        deltas.sort(reverse=True)
+        top = ["%s:%.6f/%.6f" % (name, delta, max_time)
+               for delta, name, max_time in deltas[:self.report_count]]
+        greenlets, idle_greenlets = rstats.get_greenlet_counts()
+        msg = "reactor: max_latency=%.6f greenlets=%d/%d" % (
+            rstats.pull_period_latency(), greenlets - idle_greenlets,
+            greenlets)
+        if top:
+            msg += " top=" + ",".join(top)
+        return False, msg
+
+def load_config(config):
+    return PrinterReactorStats(config)
@@ -74,9 +74,7 @@ class ShaperCalibrate:
                     "installed via `~/klippy-env/bin/pip install` (refer to "
                     "docs/Measuring_Resonances.md for more details).")
 
-    def background_process_exec(self, method, args):
-        if self.printer is None:
-            return method(*args)
+    def _start_background_process(self, method, args):
         import queuelogger
         parent_conn, child_conn = multiprocessing.Pipe()
         def wrapper():
@@ -99,6 +97,9 @@ class ShaperCalibrate:
         calc_proc = multiprocessing.Process(target=wrapper)
         calc_proc.daemon = True
         calc_proc.start()
+        return calc_proc, parent_conn
+
+    def _wait_background_process(self, calc_proc, parent_conn):
         # Wait for the process to finish
         reactor = self.printer.get_reactor()
         gcode = self.printer.lookup_object("gcode")
@@ -125,6 +126,27 @@ class ShaperCalibrate:
         parent_conn.close()
         return res
 
+    def background_process_exec(self, method, args):
+        if self.printer is None:
+            return method(*args)
+        calc_proc, parent_conn = self._start_background_process(method, args)
+        return self._wait_background_process(calc_proc, parent_conn)
+
+    def background_process_exec_all(self, method, args_list):
+        # Run several independent calculations in parallel processes
+        if self.printer is None:
+            return [method(*args) for args in args_list]
+        max_procs = max(1, multiprocessing.cpu_count() - 1)
+        running = []
+        res = []
+        for args in args_list:
+            if len(running) >= max_procs:
+                res.append(self._wait_background_process(*running.pop(0)))
+            running.append(self._start_background_process(method, args))
+        for calc_proc, parent_conn in running:
+            res.append(self._wait_background_process(calc_proc, parent_conn))
+        return res
+
     def _split_into_windows(self, x, window_size, overlap):
         # Memory-efficient algorithm to split an input 'x' into a series
         # of overlapping windows
@@ -201,31 +223,50 @@ class ShaperCalibrate:
         calibration_data.set_numpy(self.numpy)
         return calibration_data
 
-    def _estimate_shaper(self, shaper, test_damping_ratio, test_freqs):
+    def _estimate_shaper(self, shapers, test_damping_ratios, test_freqs):
+        # Evaluate a set of shapers (with impulse amplitudes and times
+        # stacked as rows of A and T) for all test damping ratios at once
         np = self.numpy
 
-        A, T = np.array(shaper[0]), np.array(shaper[1])
-        inv_D = 1. / A.sum()
+        A, T = shapers
+        inv_D = 1. / A.sum(axis=-1)
+        dr = np.array(test_damping_ratios)
 
         omega = 2. * math.pi * test_freqs
-        damping = test_damping_ratio * omega
-        omega_d = omega * math.sqrt(1. - test_damping_ratio**2)
-        W = A * np.exp(np.outer(-damping, (T[-1] - T)))
-        S = W * np.sin(np.outer(omega_d, T))
-        C = W * np.cos(np.outer(omega_d, T))
-        return np.sqrt(S.sum(axis=1)**2 + C.sum(axis=1)**2) * inv_D
-
-    def _estimate_remaining_vibrations(self, shaper, test_damping_ratio,
+        damping = np.outer(dr, omega)[:,:,None]
+        omega_d = np.outer(np.sqrt(1. - dr**2), omega)[:,:,None]
+        A = A[:,None,None,:]
+        T = T[:,None,None,:]
+        W = A * np.exp(-damping * (T[...,-1:] - T))
+        S = W * np.sin(omega_d * T)
+        C = W * np.cos(omega_d * T)
+        return (np.sqrt(S.sum(axis=-1)**2 + C.sum(axis=-1)**2)
+                * inv_D[:,None,None])
+
+    def _estimate_remaining_vibrations(self, shapers, test_damping_ratios,
                                        freq_bins, psd):
-        vals = self._estimate_shaper(shaper, test_damping_ratio, freq_bins)
+        np = self.numpy
         # The input shaper can only reduce the amplitude of vibrations by
         # SHAPER_VIBRATION_REDUCTION times, so all vibrations below that
         # threshold can be igonred
         vibr_threshold = psd.max() / shaper_defs.SHAPER_VIBRATION_REDUCTION
-        remaining_vibrations = self.numpy.maximum(
-                vals * psd - vibr_threshold, 0).sum()
-        all_vibrations = self.numpy.maximum(psd - vibr_threshold, 0).sum()
-        return (remaining_vibrations / all_vibrations, vals)
+        all_vibrations = np.maximum(psd - vibr_threshold, 0).sum()
+        # Limit the size of the intermediate arrays
+        A, T = shapers
+        chunk = max(1, (1 << 20) // (len(test_damping_ratios)
+                                     * len(freq_bins) * A.shape[-1]))
+        vibrations, shaper_vals = [], []
+        for i in range(0, A.shape[0], chunk):
+            vals = self._estimate_shaper((A[i:i+chunk], T[i:i+chunk]),
+                                         test_damping_ratios, freq_bins)
+            remaining_vibrations = np.maximum(
+                    vals * psd - vibr_threshold, 0).sum(axis=-1)
+            # Exact damping ratio of the printer is unknown, pessimizing
+            # remaining vibrations over possible damping values
+            vibrations.append(remaining_vibrations.max(axis=-1)
+                              / all_vibrations)
+            shaper_vals.append(vals.max(axis=1))
+        return np.concatenate(vibrations), np.concatenate(shaper_vals)
 
     def _get_shaper_smoothing(self, shaper, accel=5000, scv=5.):
         half_accel = accel * .5
@@ -273,50 +314,59 @@ class ShaperCalibrate:
         min_freq = max_freq
         for data in calibration_data.get_datasets():
             min_freq = min(min_freq, data.freq_bins.min())
-        for test_freq in test_freqs[::-1]:
-            shaper_vibrations = 0.
-            shaper = shaper_cfg.init_func(test_freq, damping_ratio)
-            shaper_smoothing = self._get_shaper_smoothing(shaper, scv=scv)
-            if max_smoothing and shaper_smoothing > max_smoothing and best_res:
-                return [best_res] + results
-            max_accel = self.find_shaper_max_accel(shaper, scv)
-            all_shaper_vals = []
-
-            for data in calibration_data.get_datasets():
-                freq_bins = data.freq_bins
-                psd = data.psd_sum[freq_bins <= max_freq]
-                freq_bins = freq_bins[freq_bins <= max_freq]
-
-                shaper_vals = np.zeros(shape=freq_bins.shape)
-                # Exact damping ratio of the printer is unknown, pessimizing
-                # remaining vibrations over possible damping values
-                for dr in test_damping_ratios:
-                    vibrations, vals = self._estimate_remaining_vibrations(
-                            shaper, dr, freq_bins, psd)
-                    shaper_vals = np.maximum(shaper_vals, vals)
-                    if vibrations > shaper_vibrations:
-                        shaper_vibrations = vibrations
-                all_shaper_vals.append((freq_bins, shaper_vals))
+        test_freqs = test_freqs[::-1]
+        shapers = [shaper_cfg.init_func(test_freq, damping_ratio)
+                   for test_freq in test_freqs]
+        shapers_smoothing = [self._get_shaper_smoothing(shaper, scv=scv)
+                             for shaper in shapers]
+        # Stop at the first frequency (after the highest one) that results
+        # in too much smoothing
+        num_freqs = len(shapers)
+        if max_smoothing:
+            for i in range(1, num_freqs):
+                if shapers_smoothing[i] > max_smoothing:
+                    num_freqs = i
+                    break
+        A = np.array([shaper[0] for shaper in shapers[:num_freqs]])
+        T = np.array([shaper[1] for shaper in shapers[:num_freqs]])
+
+        all_vibrations = np.zeros(shape=(num_freqs,))
+        all_shaper_vals = []
+        for data in calibration_data.get_datasets():
+            freq_bins = data.freq_bins
+            psd = data.psd_sum[freq_bins <= max_freq]
+            freq_bins = freq_bins[freq_bins <= max_freq]
+            vibrations, shaper_vals = self._estimate_remaining_vibrations(
+                    (A, T), test_damping_ratios, freq_bins, psd)
+            all_vibrations = np.maximum(all_vibrations, vibrations)
+            all_shaper_vals.append((freq_bins, shaper_vals))
+        shaper_freq_bins = np.arange(min_freq, max_freq, 0.2)
+
+        for i in range(num_freqs):
+            shaper_vibrations = all_vibrations[i]
+            shaper_smoothing = shapers_smoothing[i]
+            max_accel = self.find_shaper_max_accel(shapers[i], scv)
             # The score trying to minimize vibrations, but also accounting
             # the growth of smoothing. The formula itself does not have any
             # special meaning, it simply shows good results on real user data
             shaper_score = shaper_smoothing * (shaper_vibrations**1.5 +
                                                shaper_vibrations * .2 + .01)
-            shaper_freq_bins = np.arange(min_freq, max_freq, 0.2)
             shaper_vals = np.zeros(shape=shaper_freq_bins.shape)
             for freq_bins, vals in all_shaper_vals:
                 shaper_vals = np.maximum(
                         shaper_vals, np.interp(shaper_freq_bins,
-                                               freq_bins, vals))
+                                               freq_bins, vals[i]))
             results.append(
                     CalibrationResult(
-                        name=shaper_cfg.name, freq=test_freq,
+                        name=shaper_cfg.name, freq=test_freqs[i],
                         freq_bins=shaper_freq_bins, vals=shaper_vals,
                         vibrs=shaper_vibrations, smoothing=shaper_smoothing,
                         score=shaper_score, max_accel=max_accel))
             if best_res is None or best_res.vibrs > results[-1].vibrs:
                 # The current frequency is better for the shaper.
                 best_res = results[-1]
+        if num_freqs < len(shapers):
+            return [best_res] + results
         # Try to find an 'optimal' shapper configuration: the one that is not
         # much worse than the 'best' one, but gives much less smoothing
         selected = best_res
@@ -326,31 +376,30 @@ class ShaperCalibrate:
                 selected = res
         return [selected] + results
 
-    def _bisect(self, func):
-        left = right = 1.
-        if not func(1e-9):
-            return 0.
-        while not func(left):
-            right = left
-            left *= .5
-        if right == left:
-            while func(right):
-                right *= 2.
-        while right - left > 1e-8:
-            middle = (left + right) * .5
-            if func(middle):
-                left = middle
-            else:
-                right = middle
-        return left
-
     def find_shaper_max_accel(self, shaper, scv):
         # Just some empirically chosen value which produces good projections
         # for max_accel without much smoothing
         TARGET_SMOOTHING = 0.12
-        max_accel = self._bisect(lambda test_accel: self._get_shaper_smoothing(
-            shaper, test_accel, scv) <= TARGET_SMOOTHING)
-        return max_accel
+        A, T = shaper
+        inv_D = 1. / sum(A)
+        n = len(T)
+        ts = sum([A[i] * T[i] for i in range(n)]) * inv_D
+        # Both turn offsets (see _get_shaper_smoothing) grow linearly with
+        # the acceleration, so solve directly for the acceleration at which
+        # the larger of them reaches the target
+        offset_90 = offset_90_accel = offset_180_accel = 0.
+        for i in range(n):
+            if T[i] >= ts:
+                offset_90 += A[i] * scv * (T[i]-ts)
+                offset_90_accel += A[i] * .5 * (T[i]-ts)**2
+            offset_180_accel += A[i] * .5 * (T[i]-ts)**2
+        offset_90 *= inv_D * math.sqrt(2.)
+        offset_90_accel *= inv_D * math.sqrt(2.)
+        offset_180_accel *= inv_D
+        if offset_90 >= TARGET_SMOOTHING:
+            return 0.
+        return min((TARGET_SMOOTHING - offset_90) / offset_90_accel,
+                   TARGET_SMOOTHING / offset_180_accel)
 
     def find_best_shaper(self, calibration_data, shapers=None,
                          damping_ratio=None, scv=None, shaper_freqs=None,
@@ -359,12 +408,14 @@ class ShaperCalibrate:
         best_shaper = None
         all_shapers = []
         shapers = shapers or AUTOTUNE_SHAPERS
-        for shaper_cfg in shaper_defs.INPUT_SHAPERS:
-            if shaper_cfg.name not in shapers:
-                continue
-            fit_results = self.background_process_exec(self.fit_shaper, (
-                shaper_cfg, calibration_data, shaper_freqs, damping_ratio,
-                scv, max_smoothing, test_damping_ratios, max_freq))
+        shaper_cfgs = [shaper_cfg for shaper_cfg in shaper_defs.INPUT_SHAPERS
+                       if shaper_cfg.name in shapers]
+        # Each shaper type is fitted in its own background process
+        all_fit_results = self.background_process_exec_all(self.fit_shaper, [
+            (shaper_cfg, calibration_data, shaper_freqs, damping_ratio,
+             scv, max_smoothing, test_damping_ratios, max_freq)
+            for shaper_cfg in shaper_cfgs])
+        for fit_results in all_fit_results:
             shaper = fit_results[0]
             results = fit_results[1:]
             if (best_shaper is None or shaper.score * 1.2 < best_shaper.score or
@@ -3,7 +3,7 @@
 # Copyright (C) 2018-2024  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import os, sys, logging, io
+import os, logging, mmap, threading, bisect
 
 VALID_GCODE_EXTS = ['gcode', 'g', 'gco']
 
@@ -13,12 +13,134 @@ DEFAULT_ERROR_GCODE = """
 {% endif %}
 """
 
+# Granularity (in bytes) of the line index
+INDEX_BLOCK_SIZE = 64 * 1024
+
+# Memory mapped g-code file with a line index built in the background
+class GCodeFile:
+    def __init__(self, fname, use_mmap=True):
+        self.name = fname
+        self.file = open(fname, 'rb')
+        self.size = os.fstat(self.file.fileno()).st_size
+        self.mmap = None
+        if use_mmap and self.size:
+            self.mmap = mmap.mmap(self.file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        self.position = 0
+        self.use_mmap = self.mmap is not None
+        # Number of lines preceding the start of each index block
+        self.block_lines = [0]
+        self.is_indexed = False
+        self.must_stop_index = False
+        # Last (position, line) pair found by get_line_number()
+        self.last_line_pos = (0, 0)
+        self.index_thread = threading.Thread(target=self._build_index)
+        self.index_thread.daemon = True
+        self.index_thread.start()
+    def _build_index(self):
+        # The index is built from a separate file handle using buffered
+        # reads (a truncated file results in a short read instead of
+        # a SIGBUS from the mapping)
+        try:
+            f = open(self.name, 'rb')
+        except:
+            logging.exception("virtual_sdcard index open")
+            return
+        with f:
+            st = os.fstat(f.fileno())
+            orig_st = os.fstat(self.file.fileno())
+            if (st.st_dev, st.st_ino) != (orig_st.st_dev, orig_st.st_ino):
+                # File was replaced after it was opened
+                return
+            block_lines = self.block_lines
+            pos = count = 0
+            while pos < self.size:
+                if self.must_stop_index:
+                    return
+                size = min(INDEX_BLOCK_SIZE, self.size - pos)
+                data = f.read(size)
+                if len(data) != size:
+                    # File was truncated
+                    return
+                count += data.count(b'\n')
+                block_lines.append(count)
+                pos += size
+        self.is_indexed = True
+    def close(self):
+        self.must_stop_index = True
+        self.index_thread.join()
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
+        self.file.close()
+    def _check_size(self):
+        # Accessing the mapping past the end of a file that has been
+        # truncated raises SIGBUS, so stop using the mapping if the file
+        # size changes (eg, the file is being rewritten).  This check is
+        # not atomic - files must not be truncated while being printed
+        # unless the mapping is disabled.
+        if (self.use_mmap
+            and os.fstat(self.file.fileno()).st_size != self.size):
+            logging.info("virtual_sdcard: file '%s' changed size,"
+                         " using buffered reads", self.name)
+            self.use_mmap = False
+        return self.use_mmap
+    def _read_at(self, pos, size):
+        self.file.seek(pos)
+        return self.file.read(size)
+    def seek(self, pos):
+        self.position = pos
+    def read(self, size):
+        pos = self.position
+        if not self._check_size():
+            data = self._read_at(pos, size)
+            self.position = pos + len(data)
+            return data
+        if pos >= self.size:
+            return b''
+        self.position = min(pos + size, self.size)
+        return self.mmap[pos:self.position]
+    def get_line_number(self, pos):
+        # Return the number of lines preceding a byte offset (or None if
+        # that part of the file is not available).  Lines are counted
+        # forward from the last position found or from the closest
+        # index block.
+        last_pos, last_line = self.last_line_pos
+        block = pos // INDEX_BLOCK_SIZE
+        if block < len(self.block_lines):
+            block_pos = block * INDEX_BLOCK_SIZE
+            if block_pos > last_pos or pos < last_pos:
+                last_pos, last_line = block_pos, self.block_lines[block]
+        elif pos < last_pos:
+            return None
+        data = self._read_at(last_pos, pos - last_pos)
+        line = last_line + data.count(b'\n')
+        self.last_line_pos = (pos, line)
+        return line
+    def get_line_position(self, line):
+        # Return the byte offset of the start of a line (or None if the
+        # line is not available)
+        if not line:
+            return 0
+        if not self.is_indexed or line > self.block_lines[-1]:
+            return None
+        block = bisect.bisect_left(self.block_lines, line) - 1
+        block_pos = block * INDEX_BLOCK_SIZE
+        data = self._read_at(block_pos, INDEX_BLOCK_SIZE)
+        pos = 0
+        for i in range(line - self.block_lines[block]):
+            pos = data.find(b'\n', pos) + 1
+            if not pos:
+                return None
+        return block_pos + pos
+
 class VirtualSD:
     def __init__(self, config):
         self.printer = config.get_printer()
         # sdcard state
         sd = config.get('path')
         self.sdcard_dirname = os.path.normpath(os.path.expanduser(sd))
+        self.use_mmap = config.getboolean('use_mmap', True)
         self.current_file = None
         self.file_position = self.file_size = 0
         # Print Stat Tracking
@@ -96,11 +218,16 @@ class VirtualSD:
             'is_active': self.is_active(),
             'file_position': self.file_position,
             'file_size': self.file_size,
+            'file_line': self.file_line(),
         }
     def file_path(self):
         if self.current_file:
             return self.current_file.name
         return None
+    def file_line(self):
+        if self.current_file is None:
+            return 0
+        return self.current_file.get_line_number(self.file_position)
     def progress(self):
         if self.file_size:
             return float(self.file_position) / self.file_size
@@ -183,10 +310,8 @@ class VirtualSD:
             if fname not in flist:
                 fname = files_by_lower[fname.lower()]
             fname = os.path.join(self.sdcard_dirname, fname)
-            f = io.open(fname, 'r', newline='')
-            f.seek(0, os.SEEK_END)
-            fsize = f.tell()
-            f.seek(0)
+            f = GCodeFile(fname, self.use_mmap)
+            fsize = f.size
         except:
             logging.exception("virtual_sdcard file open")
             raise gcmd.error("Unable to open file")
@@ -206,7 +331,15 @@ class VirtualSD:
         # Set SD position
         if self.work_timer is not None:
             raise gcmd.error("SD busy")
-        pos = gcmd.get_int('S', minval=0)
+        line = gcmd.get_int('L', None, minval=0)
+        if line is None:
+            pos = gcmd.get_int('S', minval=0)
+        else:
+            if self.current_file is None:
+                raise gcmd.error("No file loaded")
+            pos = self.current_file.get_line_position(line)
+            if pos is None:
+                raise gcmd.error("Line %d not available" % (line,))
         self.file_position = pos
     def cmd_M27(self, gcmd):
         # Report SD print status
@@ -222,6 +355,27 @@ class VirtualSD:
     def is_cmd_from_sd(self):
         return self.cmd_from_sd
     # Background work timer
+    def _dispatch_lines(self, lines, gcode_mutex, need_encode):
+        # Run commands until the batch is done, a pause is requested, or
+        # another task is waiting for the gcode mutex.  Returns True if a
+        # command changed the file position.
+        while lines and not self.must_pause_work:
+            if gcode_mutex.test_waiting():
+                break
+            self.cmd_from_sd = True
+            line = lines.pop()
+            if need_encode:
+                next_file_position = (self.file_position
+                                      + len(line.encode('utf-8')) + 1)
+            else:
+                next_file_position = self.file_position + len(line) + 1
+            self.next_file_position = next_file_position
+            self.gcode.run_script_from_command(line)
+            self.cmd_from_sd = False
+            self.file_position = self.next_file_position
+            if self.next_file_position != next_file_position:
+                return True
+        return False
     def work_handler(self, eventtime):
         logging.info("Starting SD card print (position %d)", self.file_position)
         self.reactor.unregister_timer(self.work_timer)
@@ -233,8 +387,9 @@ class VirtualSD:
             return self.reactor.NEVER
         self.print_stats.note_start()
         gcode_mutex = self.gcode.get_mutex()
-        partial_input = ""
+        partial_input = b""
         lines = []
+        need_encode = False
         error_message = None
         while not self.must_pause_work:
             if not lines:
@@ -251,9 +406,20 @@ class VirtualSD:
                     logging.info("Finished SD card print")
                     self.gcode.respond_raw("Done printing file")
                     break
-                lines = data.split('\n')
-                lines[0] = partial_input + lines[0]
-                partial_input = lines.pop()
+                # Decode complete lines (a multi-byte character can not
+                # contain a newline byte)
+                data = partial_input + data
+                line_end = data.rfind(b'\n') + 1
+                partial_input = data[line_end:]
+                try:
+                    text = data[:line_end].decode('utf-8')
+                except:
+                    logging.exception("virtual_sdcard decode")
+                    break
+                # Byte offsets only need per-line encoding for non-ascii data
+                need_encode = len(text) != line_end
+                lines = text.split('\n')
+                lines.pop()
                 lines.reverse()
                 self.reactor.pause(self.reactor.NOW)
                 continue
@@ -261,16 +427,11 @@ class VirtualSD:
             if gcode_mutex.test():
                 self.reactor.pause(self.reactor.monotonic() + 0.050)
                 continue
-            # Dispatch command
-            self.cmd_from_sd = True
-            line = lines.pop()
-            if sys.version_info.major >= 3:
-                next_file_position = self.file_position + len(line.encode()) + 1
-            else:
-                next_file_position = self.file_position + len(line) + 1
-            self.next_file_position = next_file_position
+            # Dispatch commands
             try:
-                self.gcode.run_script(line)
+                with gcode_mutex:
+                    did_seek = self._dispatch_lines(lines, gcode_mutex,
+                                                    need_encode)
             except self.gcode.error as e:
                 error_message = str(e)
                 try:
@@ -281,10 +442,8 @@ class VirtualSD:
             except:
                 logging.exception("virtual_sdcard dispatch")
                 break
-            self.cmd_from_sd = False
-            self.file_position = self.next_file_position
             # Do we need to skip around?
-            if self.next_file_position != next_file_position:
+            if did_seek:
                 try:
                     self.current_file.seek(self.file_position)
                 except:
@@ -292,7 +451,7 @@ class VirtualSD:
                     self.work_timer = None
                     return self.reactor.NEVER
                 lines = []
-                partial_input = ""
+                partial_input = b""
         logging.info("Exiting SD card print (position %d)", self.file_position)
         self.work_timer = None
         self.cmd_from_sd = False
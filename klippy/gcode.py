@@ -95,6 +95,9 @@ class GCodeCommand:
         return self.get(name, default, parser=float, minval=minval,
                         maxval=maxval, above=above, below=below)
 
+# Characters that may be found in a numeric g-code parameter
+NUMBER_CHARS = "0123456789.-+"
+
 # Parse and dispatch G-Code commands
 class GCodeDispatch:
     error = CommandError
@@ -199,6 +202,37 @@ class GCodeDispatch:
         self._respond_state("Ready")
     # Parse input into commands
     args_r = re.compile('([A-Z_]+|[A-Z*])')
+    def _parse_simple_command(self, line):
+        # Fast path for the common case of a traditional command with
+        # only single letter numeric parameters (eg, "G1 X10 Y20 E.5").
+        # Returns (None, None) if the line needs the full parser.
+        parts = line.split()
+        if not parts or parts[0][0] == 'N':
+            return None, None
+        params = {}
+        for part in parts:
+            key = part[0]
+            value = part[1:]
+            if key < 'A' or key > 'Z' or value.strip(NUMBER_CHARS):
+                return None, None
+            params[key] = value
+        return parts[0], params
+    def _parse_command(self, line):
+        line = line.upper()
+        cmd, params = self._parse_simple_command(line)
+        if cmd is not None:
+            return cmd, params
+        # Break line into parts and determine command
+        parts = self.args_r.split(line)
+        if ''.join(parts[:2]) == 'N':
+            # Skip line number at start of command
+            cmd = ''.join(parts[3:5]).strip()
+        else:
+            cmd = ''.join(parts[:3]).strip()
+        # Build gcode "params" dictionary
+        params = { parts[i]: parts[i+1].strip()
+                   for i in range(1, len(parts), 2) }
+        return cmd, params
     def _process_commands(self, commands, need_ack=True):
         for line in commands:
             # Ignore comments and leading/trailing spaces
@@ -206,16 +240,7 @@ class GCodeDispatch:
             cpos = line.find(';')
             if cpos >= 0:
                 line = line[:cpos]
-            # Break line into parts and determine command
-            parts = self.args_r.split(line.upper())
-            if ''.join(parts[:2]) == 'N':
-                # Skip line number at start of command
-                cmd = ''.join(parts[3:5]).strip()
-            else:
-                cmd = ''.join(parts[:3]).strip()
-            # Build gcode "params" dictionary
-            params = { parts[i]: parts[i+1].strip()
-                       for i in range(1, len(parts), 2) }
+            cmd, params = self._parse_command(line)
             gcmd = GCodeCommand(self, cmd, origline, params, need_ack)
             # Invoke handler for command
             handler = self.gcode_handlers.get(cmd, self.cmd_default)
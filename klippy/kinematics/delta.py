@@ -116,9 +116,17 @@ class DeltaKinematics:
     def check_move(self, move):
         end_pos = move.end_pos
         end_xy2 = end_pos[0]**2 + end_pos[1]**2
-        if end_xy2 <= self.limit_xy2 and not move.axes_d[2]:
-            # Normal XY move
-            return
+        if end_xy2 <= self.limit_xy2:
+            if not move.axes_d[2]:
+                # Normal XY move
+                return
+            if self.min_z <= end_pos[2] <= self.limit_z:
+                # Z move below the tapered region (eg, vase mode) - the
+                # XY limit remains valid so only the Z speed must be checked
+                z_ratio = move.move_d / abs(move.axes_d[2])
+                move.limit_speed(self.max_z_velocity * z_ratio,
+                                 self.max_z_accel * z_ratio)
+                return
         if self.need_home:
             raise move.move_error("Must home first")
         end_z = end_pos[2]
@@ -139,7 +147,6 @@ class DeltaKinematics:
             z_ratio = move.move_d / abs(move.axes_d[2])
             move.limit_speed(self.max_z_velocity * z_ratio,
                              self.max_z_accel * z_ratio)
-            limit_xy2 = -1.
         # Limit the speed/accel of this move if is is at the extreme
         # end of the build envelope
         extreme_xy2 = max(end_xy2, move.start_pos[0]**2 + move.start_pos[1]**2)
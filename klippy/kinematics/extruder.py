@@ -172,7 +172,8 @@ class PrinterExtruder:
         # Setup extruder trapq (trapezoidal motion queue)
         self.motion_queuing = self.printer.load_object(config, 'motion_queuing')
         self.trapq = self.motion_queuing.allocate_trapq()
-        self.trapq_append = self.motion_queuing.lookup_trapq_append()
+        self.trapq_append_batch = (
+            self.motion_queuing.lookup_trapq_append_batch())
         # Setup extruder stepper
         self.extruder_stepper = None
         if (config.get('step_pin', None) is not None
@@ -238,21 +239,29 @@ class PrinterExtruder:
         if diff_r:
             return (self.instant_corner_v / abs(diff_r))**2
         return move.max_cruise_v2
-    def process_move(self, print_time, move, ea_index):
-        axis_r = move.axes_r[ea_index]
-        accel = move.accel * axis_r
-        start_v = move.start_v * axis_r
-        cruise_v = move.cruise_v * axis_r
-        can_pressure_advance = False
-        if axis_r > 0. and (move.axes_d[0] or move.axes_d[1]):
-            can_pressure_advance = True
-        # Queue movement (x is extruder movement, y is pressure advance flag)
-        self.trapq_append(self.trapq, print_time,
-                          move.accel_t, move.cruise_t, move.decel_t,
-                          move.start_pos[ea_index], 0., 0.,
-                          1., can_pressure_advance, 0.,
-                          start_v, cruise_v, accel)
-        self.last_position = move.end_pos[ea_index]
+    def process_moves(self, print_time, moves, ea_index):
+        moves_data = []
+        last_move = None
+        for move in moves:
+            if move.axes_d[ea_index]:
+                axis_r = move.axes_r[ea_index]
+                can_pressure_advance = 0.
+                if axis_r > 0. and (move.axes_d[0] or move.axes_d[1]):
+                    can_pressure_advance = 1.
+                # Queue movement (x is extruder movement, y is pressure
+                # advance flag)
+                moves_data.extend((
+                    print_time, move.accel_t, move.cruise_t, move.decel_t,
+                    move.start_pos[ea_index], 0., 0.,
+                    1., can_pressure_advance, 0.,
+                    move.start_v * axis_r, move.cruise_v * axis_r,
+                    move.accel * axis_r))
+                last_move = move
+            print_time = (print_time + move.accel_t
+                          + move.cruise_t + move.decel_t)
+        if last_move is not None:
+            self.trapq_append_batch(self.trapq, moves_data)
+            self.last_position = last_move.end_pos[ea_index]
     def find_past_position(self, print_time):
         if self.extruder_stepper is None:
             return 0.
@@ -294,6 +303,8 @@ class DummyExtruder:
         self.printer = printer
     def check_move(self, move, ea_index):
         raise move.move_error("Extrude when no extruder present")
+    def process_moves(self, print_time, moves, ea_index):
+        pass
     def find_past_position(self, print_time):
         return 0.
     def calc_junction(self, prev_move, move, ea_index):
@@ -22,6 +22,60 @@ command to reload the config and restart the host software.
 Printer is halted
 """
 
+# Record wall time spent in each phase of printer startup
+class StartupProfile:
+    REPORT_COUNT = 30
+    def __init__(self, printer):
+        self.monotonic = printer.get_reactor().monotonic
+        self.start_time = self.monotonic()
+        self.end_time = None
+        self.entries = []
+    def record(self, category, name, start_time):
+        curtime = self.monotonic()
+        self.entries.append((curtime - start_time, category, name))
+        return curtime
+    def call(self, category, name, func, *args):
+        start_time = self.monotonic()
+        try:
+            return func(*args)
+        finally:
+            self.record(category, name, start_time)
+    def finish(self):
+        self.end_time = self.monotonic()
+        entries = sorted(self.entries, reverse=True)
+        totals = {}
+        for duration, category, name in entries:
+            totals[category] = totals.get(category, 0.) + duration
+        lines = ["Startup profile (%.3fs total):"
+                 % (self.end_time - self.start_time,)]
+        lines.extend(["  %s: %.6f" % (category, duration)
+                      for category, duration in sorted(totals.items())])
+        lines.extend(["  %.6f %s %s" % (duration, category, name)
+                      for duration, category, name
+                      in entries[:self.REPORT_COUNT]])
+        if len(entries) > self.REPORT_COUNT:
+            lines.append("  (+%d entries)"
+                         % (len(entries) - self.REPORT_COUNT,))
+        logging.info("\n".join(lines))
+    def get_status(self):
+        total_time = None
+        if self.end_time is not None:
+            total_time = self.end_time - self.start_time
+        entries = [{'category': category, 'name': name, 'time': duration}
+                   for duration, category, name in sorted(self.entries,
+                                                          reverse=True)]
+        return {'total_time': total_time, 'entries': entries}
+
+def _handler_name(cb):
+    name = getattr(cb, '__qualname__', None) or getattr(cb, '__name__', None)
+    if name is None:
+        name = type(cb).__name__
+    obj = getattr(cb, '__self__', None)
+    get_name = getattr(obj, 'get_name', None)
+    if callable(get_name):
+        name = "%s (%s)" % (name, get_name())
+    return name
+
 class Printer:
     config_error = configfile.error
     command_error = gcode.CommandError
@@ -35,13 +89,24 @@ class Printer:
         self.run_result = None
         self.event_handlers = {}
         self.objects = collections.OrderedDict()
+        self.startup_profile = None
+        if start_args.get('profile_startup'):
+            self.startup_profile = StartupProfile(self)
         # Init printer components that must be setup prior to config
         for m in [gcode, webhooks]:
             m.add_early_printer_objects(self)
+        if self.startup_profile is not None:
+            wh = self.objects['webhooks']
+            wh.register_endpoint("startup_profile/dump",
+                                 self._handle_dump_startup_profile)
     def get_start_args(self):
         return self.start_args
     def get_reactor(self):
         return self.reactor
+    def get_startup_profile(self):
+        return self.startup_profile
+    def _handle_dump_startup_profile(self, web_request):
+        web_request.send(self.startup_profile.get_status())
     def get_state_message(self):
         if self.state_message == message_ready:
             category = "ready"
@@ -100,7 +165,13 @@ class Printer:
             if default is not configfile.sentinel:
                 return default
             raise self.config_error("Unable to load module '%s'" % (section,))
-        mod = importlib.import_module('extras.' + module_name)
+        full_name = 'extras.' + module_name
+        profile = self.startup_profile
+        if profile is not None and full_name not in sys.modules:
+            mod = profile.call("import", full_name,
+                               importlib.import_module, full_name)
+        else:
+            mod = importlib.import_module(full_name)
         init_func = 'load_config'
         if len(module_parts) > 1:
             init_func = 'load_config_prefix'
@@ -109,30 +180,55 @@ class Printer:
             if default is not configfile.sentinel:
                 return default
             raise self.config_error("Unable to load module '%s'" % (section,))
-        self.objects[section] = init_func(config.getsection(section))
+        if profile is not None:
+            # Times include any objects loaded by this object
+            self.objects[section] = profile.call(
+                "load_config", section, init_func, config.getsection(section))
+        else:
+            self.objects[section] = init_func(config.getsection(section))
         return self.objects[section]
+    def _call_profiled(self, category, name, func, *args):
+        if self.startup_profile is None:
+            return func(*args)
+        return self.startup_profile.call(category, name, func, *args)
     def _read_config(self):
         self.objects['configfile'] = pconfig = configfile.PrinterConfig(self)
-        config = pconfig.read_main_config()
+        config = self._call_profiled("config", "read_main_config",
+                                     pconfig.read_main_config)
         if self.bglogger is not None:
             pconfig.log_config(config)
         # Create printer components
         for m in [pins, mcu]:
-            m.add_printer_objects(config)
+            self._call_profiled("load_config", m.__name__,
+                                m.add_printer_objects, config)
         for section_config in config.get_prefix_sections(''):
             self.load_object(config, section_config.get_name(), None)
         for m in [toolhead]:
-            m.add_printer_objects(config)
+            self._call_profiled("load_config", m.__name__,
+                                m.add_printer_objects, config)
         # Validate that there are no undefined parameters in the config file
         pconfig.check_unused_options(config)
     def _connect(self, eventtime):
+        self._connect_printer()
+        if self.startup_profile is not None:
+            self.startup_profile.finish()
+    def _run_startup_handlers(self, event, state):
+        profile = self.startup_profile
+        for cb in self.event_handlers.get(event, []):
+            if state is not None and self.state_message is not state:
+                return False
+            if profile is not None:
+                profile.call(event, _handler_name(cb), cb)
+            else:
+                cb()
+        return True
+    def _connect_printer(self):
         try:
             self._read_config()
-            self.send_event("klippy:mcu_identify")
-            for cb in self.event_handlers.get("klippy:connect", []):
-                if self.state_message is not message_startup:
-                    return
-                cb()
+            self._run_startup_handlers("klippy:mcu_identify", None)
+            if not self._run_startup_handlers("klippy:connect",
+                                              message_startup):
+                return
         except (self.config_error, pins.error) as e:
             logging.exception("Config error")
             self._set_state("%s\n%s" % (str(e), message_restart))
@@ -159,10 +255,7 @@ class Printer:
         try:
             self._set_state(message_ready)
             with self.reactor.assert_no_pause():
-                for cb in self.event_handlers.get("klippy:ready", []):
-                    if self.state_message is not message_ready:
-                        return
-                    cb()
+                self._run_startup_handlers("klippy:ready", message_ready)
         except Exception as e:
             logging.exception("Unhandled exception during ready callback")
             self.invoke_shutdown("Internal error during ready callback: %s"
@@ -280,6 +373,10 @@ def main():
                     help="file to read for mcu protocol dictionary")
     opts.add_option("--import-test", action="store_true",
                     help="perform an import module test")
+    opts.add_option("--config-cache", dest="configcache",
+                    help="file to cache the parsed config file in")
+    opts.add_option("--profile-startup", action="store_true",
+                    help="log the time spent in each phase of startup")
     options, args = opts.parse_args()
     if options.import_test:
         import_test()
@@ -287,6 +384,10 @@ def main():
         opts.error("Incorrect number of arguments")
     start_args = {'config_file': args[0], 'apiserver': options.apiserver,
                   'start_reason': 'startup'}
+    if options.configcache:
+        start_args['config_cache'] = options.configcache
+    if options.profile_startup:
+        start_args['profile_startup'] = True
 
     debuglevel = logging.INFO
     if options.verbose:
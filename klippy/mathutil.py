@@ -47,14 +47,14 @@ def coordinate_descent(adj_params, params, error_func):
                  best_err, rounds)
     return params
 
-# Helper to run the coordinate descent function in a background
-# process so that it does not block the main thread.
-def background_coordinate_descent(printer, adj_params, params, error_func):
+# Helper to run a function in a background process so that it does
+# not block the main thread.
+def background_call(printer, name, func, *args):
     parent_conn, child_conn = multiprocessing.Pipe()
     def wrapper():
         queuelogger.clear_bg_logging()
         try:
-            res = coordinate_descent(adj_params, params, error_func)
+            res = func(*args)
         except:
             child_conn.send((True, traceback.format_exc()))
             child_conn.close()
@@ -65,23 +65,34 @@ def background_coordinate_descent(printer, adj_params, params, error_func):
     calc_proc = multiprocessing.Process(target=wrapper)
     calc_proc.daemon = True
     calc_proc.start()
-    # Wait for the process to finish
+    # Wait for the process to send its result (a large result may not
+    # fit in the pipe buffer, so it must be read before the process exits)
     reactor = printer.get_reactor()
     gcode = printer.lookup_object("gcode")
     eventtime = last_report_time = reactor.monotonic()
-    while calc_proc.is_alive():
+    delay = .005
+    while calc_proc.is_alive() and not parent_conn.poll():
         if eventtime > last_report_time + 5.:
             last_report_time = eventtime
-            gcode.respond_info("Working on calibration...", log=False)
-        eventtime = reactor.pause(eventtime + .1)
+            gcode.respond_info("Working on %s..." % (name,), log=False)
+        eventtime = reactor.pause(eventtime + delay)
+        delay = min(2. * delay, .1)
     # Return results
+    if not parent_conn.poll():
+        raise Exception("Error in %s: background process failed" % (name,))
     is_err, res = parent_conn.recv()
     if is_err:
-        raise Exception("Error in coordinate descent: %s" % (res,))
+        raise Exception("Error in %s: %s" % (name, res))
     calc_proc.join()
     parent_conn.close()
     return res
 
+# Helper to run the coordinate descent function in a background
+# process so that it does not block the main thread.
+def background_coordinate_descent(printer, adj_params, params, error_func):
+    return background_call(printer, "calibration", coordinate_descent,
+                           adj_params, params, error_func)
+
 
 ######################################################################
 # Trilateration
@@ -130,12 +130,14 @@ class CommandWrapper:
 
 # Wrapper for long-lived serial subscriptions (callbacks via background thread)
 class AsyncResponseWrapper:
-    def __init__(self, conn_helper, cfg_helper, callback, msgformat, oid=None):
+    def __init__(self, conn_helper, cfg_helper, callback, msgformat, oid=None,
+                 is_raw=False):
         self._serial = conn_helper.get_serial()
         self._callback = callback
         self._msgformat = msgformat
         self._name = msgformat.split()[0]
         self._oid = oid
+        self._is_raw = is_raw
         if cfg_helper.is_config_finalized():
             self._register()
         else:
@@ -143,9 +145,19 @@ class AsyncResponseWrapper:
             cfg_helper.register_post_init_callback(self._register)
     def _register(self):
         self._serial.get_msgparser().lookup_command(self._msgformat)
+        if self._is_raw:
+            self._serial.register_raw_response(self._callback, self._name,
+                                               self._oid)
+            return
         self._serial.register_response(self._callback, self._name, self._oid)
     def unregister(self):
+        if self._is_raw:
+            self._serial.register_raw_response(None, self._name, self._oid)
+            return
         self._serial.register_response(None, self._name, self._oid)
+    def parse_raw(self, data):
+        # Decode a message delivered to a raw callback
+        return self._serial.get_msgparser().parse(data)
 
 
 ######################################################################
@@ -1044,14 +1056,23 @@ class MCUConfigHelper:
             raise error("Can not update MCU '%s' config as it is shutdown" % (
                 self._name,))
         return config_params
+    def _profile_phase(self, phase, start_time):
+        profile = self._printer.get_startup_profile()
+        if profile is None:
+            return start_time
+        return profile.record("mcu_config", "%s %s" % (self._name, phase),
+                              start_time)
     def _connect(self):
         # Finalize the config and check if a restart is needed
         restart_helper = self._conn_helper.get_restart_helper()
+        ptime = self._reactor.monotonic()
         config_params = self._send_get_config()
+        ptime = self._profile_phase("get_config", ptime)
         if not config_params['is_config']:
             # Not configured - sending full config will be required
             restart_helper.check_restart_on_send_config()
             self._finalize_config()
+            ptime = self._profile_phase("finalize_config", ptime)
             cfg_init_cmds = self._config_cmds + self._init_cmds
             logging.info("Sending MCU '%s' printer configuration...",
                          self._name)
@@ -1062,6 +1083,7 @@ class MCUConfigHelper:
                 raise error("Failed automated reset of MCU '%s'"
                             % (self._name,))
             self._finalize_config()
+            ptime = self._profile_phase("finalize_config", ptime)
             if self._config_crc != config_params['crc']:
                 restart_helper.check_restart_on_crc_mismatch()
                 raise error("MCU '%s' CRC does not match config"
@@ -1070,11 +1092,13 @@ class MCUConfigHelper:
         # Send config and init messages
         self._send_cfg_init_commands(cfg_init_cmds)
         config_params = self._send_get_config()
+        ptime = self._profile_phase("send_config", ptime)
         if not config_params['is_config'] and not self._mcu.is_fileoutput():
             raise error("Unable to configure MCU '%s'" % (self._name,))
         # Run post_init callbacks
         for cb in self._post_init_callbacks:
             cb()
+        self._profile_phase("post_init", ptime)
         # Setup steppersync with the move_count returned by get_config
         move_count = config_params['move_count']
         if move_count < self._reserved_move_slots:
@@ -1201,9 +1225,9 @@ class MCU:
             return None
     def alloc_command_queue(self):
         return self._serial.alloc_command_queue()
-    def register_serial_response(self, cb, msg, oid=None):
+    def register_serial_response(self, cb, msg, oid=None, is_raw=False):
         return AsyncResponseWrapper(self._conn_helper, self._config_helper,
-                                    cb, msg, oid)
+                                    cb, msg, oid, is_raw)
     def check_valid_response(self, msgformat):
         try:
             self._serial.get_msgparser().lookup_command(msgformat)
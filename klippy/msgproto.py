@@ -26,12 +26,19 @@ MESSAGE_SYNC = 0x7e
 class error(Exception):
     pass
 
+def _build_crc16_table():
+    table = []
+    for data in range(256):
+        data ^= (data & 0x0f) << 4
+        table.append(((data << 8) ^ (data >> 4) ^ (data << 3)) & 0xffff)
+    return table
+CRC16_TABLE = _build_crc16_table()
+
 def crc16_ccitt(buf):
     crc = 0xffff
+    table = CRC16_TABLE
     for data in buf:
-        data ^= crc & 0xff
-        data ^= (data & 0x0f) << 4
-        crc = ((data << 8) | (crc >> 8)) ^ (data >> 4) ^ (data << 3)
+        crc = (crc >> 8) ^ table[(data ^ crc) & 0xff]
     return [crc >> 8, crc & 0xff]
 
 class PT_uint32:
@@ -159,6 +166,55 @@ def convert_msg_format(msgformat):
         msgformat = msgformat.replace(c, '%s')
     return msgformat
 
+# Generate specialized parse() and encode() functions for a message.
+# Integers are parsed inline (and encoded inline if they fit in a single
+# byte) and all other parameters use the parameter type's methods.
+def build_message_codecs(msgid_bytes, param_names):
+    glbls = {}
+    parse_code = ["def parse(s, pos):",
+                  "    pos += %d" % (len(msgid_bytes),)]
+    encode_code = ["def encode(params):",
+                   "    out = %s" % (repr(list(msgid_bytes)),)]
+    for i, (name, t) in enumerate(param_names):
+        glbls['parse%d' % (i,)] = t.parse
+        glbls['encode%d' % (i,)] = t.encode
+        if t.is_int:
+            # Inline version of PT_uint32.parse()
+            parse_code += ["    c = s[pos]",
+                           "    pos += 1",
+                           "    v%d = c & 0x7f" % (i,),
+                           "    if c >= 0x60:",
+                           "        if (c & 0x60) == 0x60:",
+                           "            v%d |= -0x20" % (i,),
+                           "        while c & 0x80:",
+                           "            c = s[pos]",
+                           "            pos += 1",
+                           "            v%d = (v%d<<7) | (c & 0x7f)" % (i, i)]
+            if not t.signed:
+                parse_code.append(
+                    "        v%d = int(v%d & 0xffffffff)" % (i, i))
+            encode_code += ["    v = params[%d]" % (i,),
+                            "    if -0x20 <= v < 0x60:",
+                            "        out.append(v & 0x7f)",
+                            "    else:",
+                            "        encode%d(out, v)" % (i,)]
+        elif t.is_dynamic_string:
+            parse_code += ["    l = s[pos]",
+                           "    v%d = bytes(bytearray(s[pos+1:pos+l+1]))" % (
+                               i,),
+                           "    pos += l + 1"]
+            encode_code += ["    encode%d(out, params[%d])" % (i, i)]
+        else:
+            parse_code += ["    v%d, pos = parse%d(s, pos)" % (i, i)]
+            encode_code += ["    encode%d(out, params[%d])" % (i, i)]
+    parse_code.append("    return {%s}, pos" % (", ".join([
+        "%s: v%d" % (repr(name), i)
+        for i, (name, t) in enumerate(param_names)]),))
+    encode_code.append("    return out")
+    code = "\n".join(parse_code + encode_code) + "\n"
+    exec(compile(code, "<msgproto>", "exec"), glbls)
+    return glbls['parse'], glbls['encode']
+
 class MessageFormat:
     def __init__(self, msgid_bytes, msgformat, enumerations={}):
         self.msgid_bytes = msgid_bytes
@@ -168,23 +224,13 @@ class MessageFormat:
         self.param_names = lookup_params(msgformat, enumerations)
         self.param_types = [t for name, t in self.param_names]
         self.name_to_type = dict(self.param_names)
-    def encode(self, params):
-        out = list(self.msgid_bytes)
-        for i, t in enumerate(self.param_types):
-            t.encode(out, params[i])
-        return out
+        self.parse, self.encode = build_message_codecs(msgid_bytes,
+                                                       self.param_names)
     def encode_by_name(self, **params):
         out = list(self.msgid_bytes)
         for name, t in self.param_names:
             t.encode(out, params[name])
         return out
-    def parse(self, s, pos):
-        pos += len(self.msgid_bytes)
-        out = {}
-        for name, t in self.param_names:
-            v, pos = t.parse(s, pos)
-            out[name] = v
-        return out, pos
     def format_params(self, params):
         out = []
         for name, t in self.param_names:
@@ -282,7 +328,9 @@ class MessageParser:
             return "%s %s" % (name, msg)
         return str(params)
     def parse(self, s):
-        msgid, param_pos = self.msgid_parser.parse(s, MESSAGE_HEADER_SIZE)
+        msgid = s[MESSAGE_HEADER_SIZE]
+        if msgid >= 0x60:
+            msgid, param_pos = self.msgid_parser.parse(s, MESSAGE_HEADER_SIZE)
         mid = self.messages_by_id.get(msgid, self.unknown)
         params, pos = mid.parse(s, MESSAGE_HEADER_SIZE)
         if pos != len(s)-MESSAGE_TRAILER_SIZE:
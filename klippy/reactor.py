@@ -3,7 +3,7 @@
 # Copyright (C) 2016-2025  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import os, gc, select, math, time, logging, queue
+import os, gc, select, math, time, logging, queue, heapq, bisect
 import greenlet
 import chelper, util
 
@@ -18,6 +18,8 @@ class ReactorTimer:
         self.callback = callback
         self.waketime = waketime
         self.timer_is_running = False
+        self.heap_entry = None
+        self.stats_name = None
 
 class ReactorCompletion:
     class sentinel: pass
@@ -46,6 +48,8 @@ class ReactorCallback:
         self.reactor = reactor
         self.timer = reactor.register_timer(self.invoke, waketime)
         self.callback = callback
+        if reactor._stats is not None:
+            self.timer.stats_name = _callback_name(callback)
         self.completion = ReactorCompletion(reactor)
     def invoke(self, eventtime):
         self.reactor.unregister_timer(self.timer)
@@ -74,6 +78,8 @@ class ReactorMutex:
         self.unlock = self.__exit__
     def test(self):
         return self.is_locked
+    def test_waiting(self):
+        return len(self.queue) > 0
     def __enter__(self):
         if not self.is_locked:
             self.is_locked = True
@@ -93,6 +99,79 @@ class ReactorMutex:
         self.next_pending = True
         self.reactor.update_timer(self.queue[0].timer, self.reactor.NOW)
 
+def _callback_name(callback):
+    name = getattr(callback, '__qualname__', None)
+    if name is not None:
+        return name
+    # Python2 does not provide __qualname__
+    name = getattr(callback, '__name__', None)
+    if name is None:
+        return type(callback).__name__
+    cls = getattr(callback, 'im_class', None)
+    if cls is not None:
+        return "%s.%s" % (cls.__name__, name)
+    return name
+
+# Track the run time of timer, fd, and greenlet callbacks
+class ReactorStats:
+    HISTOGRAM_BUCKETS = (.0001, .0005, .001, .005, .025, .100)
+    def __init__(self, reactor):
+        self.reactor = reactor
+        self.monotonic = reactor.monotonic
+        self.callbacks = {}
+        self.max_latency = 0.
+        self.max_latency_name = None
+        # Maximum latency since the last call to pull_period_latency()
+        self.period_max_latency = 0.
+        self.cur_name = None
+        self.cur_start = 0.
+    def start(self, name, waketime=_NOW):
+        curtime = self.monotonic()
+        if waketime > _NOW:
+            latency = curtime - waketime
+            if latency > self.period_max_latency:
+                self.period_max_latency = latency
+                if latency > self.max_latency:
+                    self.max_latency = latency
+                    self.max_latency_name = name
+        self.cur_name = name
+        self.cur_start = curtime
+    def pull_period_latency(self):
+        max_latency = self.period_max_latency
+        self.period_max_latency = 0.
+        return max_latency
+    def finish(self):
+        name = self.cur_name
+        if name is None:
+            return
+        self.cur_name = None
+        run_time = self.monotonic() - self.cur_start
+        cs = self.callbacks.get(name)
+        if cs is None:
+            histogram = [0] * (len(self.HISTOGRAM_BUCKETS) + 1)
+            cs = self.callbacks[name] = [0, 0., 0., histogram]
+        cs[0] += 1
+        cs[1] += run_time
+        if run_time > cs[2]:
+            cs[2] = run_time
+        cs[3][bisect.bisect(self.HISTOGRAM_BUCKETS, run_time)] += 1
+    def get_greenlet_counts(self):
+        reactor = self.reactor
+        return len(reactor._all_greenlets), len(reactor._greenlets)
+    def get_status(self):
+        total, idle = self.get_greenlet_counts()
+        callbacks = {}
+        for name, (count, total_time, max_time, histogram) in sorted(
+                self.callbacks.items()):
+            callbacks[name] = {'count': count, 'total_time': total_time,
+                               'max_time': max_time,
+                               'histogram': list(histogram)}
+        return {'max_latency': self.max_latency,
+                'max_latency_callback': self.max_latency_name,
+                'greenlets': total, 'idle_greenlets': idle,
+                'histogram_buckets': list(self.HISTOGRAM_BUCKETS),
+                'callbacks': callbacks}
+
 class ReactorPreventPause:
     def __init__(self, reactor):
         self.reactor = reactor
@@ -112,8 +191,12 @@ class SelectReactor:
         self._check_gc = gc_checking
         self._last_gc_times = [0., 0., 0.]
         # Timers
-        self._timers = []
+        self._timers = set()
+        self._timer_heap = []
+        self._timer_seq = 0
+        self._timer_deferred = []
         self._next_timer = self.NEVER
+        self._stats = None
         # Callbacks
         self._pipe_fds = None
         self._async_queue = queue.Queue()
@@ -132,24 +215,48 @@ class SelectReactor:
         self._prevent_pause_count = 0
     def get_gc_stats(self):
         return tuple(self._last_gc_times)
+    def enable_stats(self):
+        if self._stats is None:
+            self._stats = ReactorStats(self)
+        return self._stats
     # Timers
+    #
+    # Timers are tracked in a heap ordered by wake time.  A heap entry is
+    # only added when a timer is to wake earlier than its current entry
+    # (later wake times are noticed when the earlier entry is reached),
+    # and replaced entries are discarded as they are encountered.
+    def _schedule_timer(self, timer_handler):
+        waketime = timer_handler.waketime
+        entry = timer_handler.heap_entry
+        if waketime >= self.NEVER or (entry is not None
+                                      and entry[0] <= waketime):
+            return
+        self._timer_seq += 1
+        entry = timer_handler.heap_entry = (waketime, self._timer_seq,
+                                            timer_handler)
+        heap = self._timer_heap
+        heapq.heappush(heap, entry)
+        if waketime < self._next_timer:
+            self._next_timer = waketime
+        if len(heap) > 2 * len(self._timers) + 32:
+            # Too many replaced entries - rebuild the heap
+            heap[:] = [e for e in heap if e[2].heap_entry is e]
+            heapq.heapify(heap)
     def update_timer(self, timer_handler, waketime):
         if timer_handler.timer_is_running:
             return
         timer_handler.waketime = waketime
-        self._next_timer = min(self._next_timer, waketime)
+        if timer_handler in self._timers:
+            self._schedule_timer(timer_handler)
     def register_timer(self, callback, waketime=NEVER):
         timer_handler = ReactorTimer(callback, waketime)
-        timers = list(self._timers)
-        timers.append(timer_handler)
-        self._timers = timers
-        self._next_timer = min(self._next_timer, waketime)
+        self._timers.add(timer_handler)
+        self._schedule_timer(timer_handler)
         return timer_handler
     def unregister_timer(self, timer_handler):
         timer_handler.waketime = self.NEVER
-        timers = list(self._timers)
-        timers.pop(timers.index(timer_handler))
-        self._timers = timers
+        timer_handler.heap_entry = None
+        self._timers.remove(timer_handler)
     def _check_timers(self, eventtime, busy):
         if eventtime < self._next_timer:
             if busy:
@@ -167,21 +274,47 @@ class SelectReactor:
                     gc.collect(gc_level)
                     return 0.
             return min(1., max(.001, self._next_timer - eventtime))
-        self._next_timer = self.NEVER
+        heap = self._timer_heap
+        last_seq = self._timer_seq
+        deferred = self._timer_deferred = []
         g_dispatch = self._g_dispatch
-        for t in self._timers:
+        while heap and heap[0][0] <= eventtime:
+            entry = heapq.heappop(heap)
+            t = entry[2]
+            if t.heap_entry is not entry:
+                continue
+            if entry[1] > last_seq:
+                # Scheduled during this pass - run it on the next pass
+                deferred.append(entry)
+                continue
+            t.heap_entry = None
             waketime = t.waketime
-            if eventtime >= waketime:
-                t.waketime = self.NEVER
-                t.timer_is_running = True
-                t.waketime = waketime = t.callback(eventtime)
-                t.timer_is_running = False
-                if g_dispatch is not self._g_dispatch:
-                    self._next_timer = min(self._next_timer, waketime)
-                    self._end_greenlet(g_dispatch)
-                    return 0.
-            self._next_timer = min(self._next_timer, waketime)
+            if eventtime < waketime:
+                self._schedule_timer(t)
+                continue
+            t.waketime = self.NEVER
+            t.timer_is_running = True
+            stats = self._stats
+            if stats is not None:
+                stats.start(t.stats_name or _callback_name(t.callback),
+                            waketime)
+            t.waketime = t.callback(eventtime)
+            t.timer_is_running = False
+            if t in self._timers:
+                self._schedule_timer(t)
+            if g_dispatch is not self._g_dispatch:
+                self._end_greenlet(g_dispatch)
+                return 0.
+            if stats is not None:
+                stats.finish()
+        self._restore_deferred_timers()
+        self._next_timer = heap[0][0] if heap else self.NEVER
         return 0.
+    def _restore_deferred_timers(self):
+        deferred = self._timer_deferred
+        for entry in deferred:
+            heapq.heappush(self._timer_heap, entry)
+        del deferred[:]
     # Callbacks and Completions
     def completion(self):
         return ReactorCompletion(self)
@@ -237,6 +370,12 @@ class SelectReactor:
         # Pausing the dispatch greenlet - prepare a new greenlet to do dispatch
         if self._prevent_pause_count:
             self.verify_can_pause()
+        self._restore_deferred_timers()
+        stats = self._stats
+        if stats is not None:
+            # The remainder of the callback runs from a greenlet timer
+            stats_name = stats.cur_name
+            stats.finish()
         if self._greenlets:
             g_next = self._greenlets.pop()
         else:
@@ -244,6 +383,8 @@ class SelectReactor:
             self._all_greenlets.append(g_next)
         g_next.parent = g.parent
         g.timer = self.register_timer(g.switch, waketime)
+        if stats is not None:
+            g.timer.stats_name = stats_name
         self._next_timer = self.NOW
         # Switch to _dispatch_loop (via _end_greenlet or direct)
         eventtime = g_next.switch()
@@ -290,18 +431,27 @@ class SelectReactor:
             self._write_fds.append(fd)
     def _check_fds(self, eventtime, hdls):
         g_dispatch = self._g_dispatch
+        stats = self._stats
         for fd, event in hdls:
             hdl = self._fds.get(fd, self._dummy_fd_hdl)
             if event & self._READ:
+                if stats is not None:
+                    stats.start(_callback_name(hdl.read_callback))
                 hdl.read_callback(eventtime)
                 if g_dispatch is not self._g_dispatch:
                     self._end_greenlet(g_dispatch)
                     return self.monotonic()
+                if stats is not None:
+                    stats.finish()
             if event & self._WRITE:
+                if stats is not None:
+                    stats.start(_callback_name(hdl.write_callback))
                 hdl.write_callback(eventtime)
                 if g_dispatch is not self._g_dispatch:
                     self._end_greenlet(g_dispatch)
                     return self.monotonic()
+                if stats is not None:
+                    stats.finish()
         return eventtime
     # Main loop
     def _dispatch_loop(self):
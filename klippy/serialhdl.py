@@ -33,6 +33,8 @@ class SerialReader:
         self.background_thread = None
         # Message handlers
         self.handlers = {}
+        self.raw_handlers_by_name = {}
+        self.raw_handlers = {}
         self.register_response(self._handle_unknown_init, '#unknown')
         self.register_response(self.handle_output, '#output')
         # Sent message notification tracking
@@ -53,6 +55,27 @@ class SerialReader:
                 completion = self.pending_notifications.pop(response.notify_id)
                 self.reactor.async_complete(completion, params)
                 continue
+            raw_handlers = self.raw_handlers
+            if raw_handlers:
+                # Check for a raw handler (without decoding the message)
+                msg = response.msg
+                msgid_parse = self.msgparser.msgid_parser.parse
+                msgid, pos = msgid_parse(msg, msgproto.MESSAGE_HEADER_SIZE)
+                rh = raw_handlers.get(msgid)
+                if rh is not None:
+                    has_oid, oid_handlers = rh
+                    oid = None
+                    if has_oid:
+                        oid, pos = msgid_parse(msg, pos)
+                    hdl = oid_handlers.get(oid)
+                    if hdl is not None:
+                        try:
+                            hdl(bytearray(self.ffi_main.buffer(msg, count)),
+                                response.receive_time)
+                        except:
+                            logging.exception("%sException in serial callback",
+                                              self.warn_prefix)
+                        continue
             params = self.msgparser.parse(response.msg[0:count])
             params['#sent_time'] = response.sent_time
             params['#receive_time'] = response.receive_time
@@ -102,6 +125,7 @@ class SerialReader:
         msgparser = msgproto.MessageParser(warn_prefix=self.warn_prefix)
         msgparser.process_identify(identify_data)
         self.msgparser = msgparser
+        self._update_raw_handlers()
         self.register_response(self.handle_unknown, '#unknown')
         # Setup baud adjust
         if serial_fd_type == b'c':
@@ -247,6 +271,34 @@ class SerialReader:
                 del self.handlers[name, oid]
             else:
                 self.handlers[name, oid] = callback
+    # Raw response callbacks are invoked from the background thread
+    # (without holding self.lock) with the undecoded message block and
+    # its receive time.  The message may be decoded later with the
+    # msgparser parse() method.
+    def register_raw_response(self, callback, name, oid=None):
+        raw_handlers_by_name = dict(self.raw_handlers_by_name)
+        if callback is None:
+            del raw_handlers_by_name[name, oid]
+        else:
+            raw_handlers_by_name[name, oid] = callback
+        self.raw_handlers_by_name = raw_handlers_by_name
+        self._update_raw_handlers()
+    def _update_raw_handlers(self):
+        # Build a new handler table indexed by message id (the background
+        # thread uses the table without locking)
+        msgparser = self.msgparser
+        raw_handlers = {}
+        for (name, oid), callback in self.raw_handlers_by_name.items():
+            mp = msgparser.messages_by_name.get(name)
+            if mp is None:
+                continue
+            has_oid = mp.param_names and mp.param_names[0][0] == 'oid'
+            if oid is not None and not has_oid:
+                self._error("Raw response %s must start with an oid", name)
+            msgid = msgparser.lookup_msgid(mp.msgformat)
+            rh = raw_handlers.setdefault(msgid, (has_oid, {}))
+            rh[1][oid] = callback
+        self.raw_handlers = raw_handlers
     # Command sending
     def raw_send(self, cmd, minclock, reqclock, cmd_queue):
         self.ffi_lib.serialqueue_send(self.serialqueue, cmd_queue,
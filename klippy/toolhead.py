@@ -11,24 +11,39 @@ import mcu, chelper, kinematics.extruder
 #   seconds), _r is ratio (scalar between 0.0 and 1.0)
 
 # Class to track each move request
-class Move:
+class Move(object):
+    __slots__ = (
+        'toolhead', 'start_pos', 'end_pos', 'accel', 'junction_deviation',
+        'timing_callbacks', 'is_kinematic_move', 'axes_d', 'axes_r', 'move_d',
+        'min_move_t', 'max_start_v2', 'max_cruise_v2', 'delta_v2',
+        'next_junction_v2', 'max_mcr_start_v2', 'mcr_delta_v2',
+        'flush_start_v2', 'flush_cruise_v2', 'flush_end_v2',
+        'start_v', 'cruise_v', 'end_v', 'accel_t', 'cruise_t', 'decel_t')
     def __init__(self, toolhead, start_pos, end_pos, speed):
         self.toolhead = toolhead
-        self.start_pos = tuple(start_pos)
-        self.end_pos = tuple(end_pos)
+        self.start_pos = start_pos = tuple(start_pos)
+        self.end_pos = end_pos = tuple(end_pos)
         self.accel = toolhead.max_accel
         self.junction_deviation = toolhead.junction_deviation
-        self.timing_callbacks = []
+        # List of callbacks is only allocated when a callback is registered
+        self.timing_callbacks = None
         velocity = min(speed, toolhead.max_velocity)
         self.is_kinematic_move = True
-        self.axes_d = axes_d = [ep - sp for sp, ep in zip(start_pos, end_pos)]
-        self.move_d = move_d = math.sqrt(sum([d*d for d in axes_d[:3]]))
+        axis_x_d = end_pos[0] - start_pos[0]
+        axis_y_d = end_pos[1] - start_pos[1]
+        axis_z_d = end_pos[2] - start_pos[2]
+        move_d = math.sqrt(axis_x_d*axis_x_d + axis_y_d*axis_y_d
+                           + axis_z_d*axis_z_d)
+        if len(end_pos) == 4:
+            axes_d = (axis_x_d, axis_y_d, axis_z_d, end_pos[3] - start_pos[3])
+        else:
+            axes_d = (axis_x_d, axis_y_d, axis_z_d) + tuple(
+                [ep - sp for sp, ep in zip(start_pos[3:], end_pos[3:])])
         if move_d < .000000001:
             # Extrude only move
-            self.end_pos = ((start_pos[0], start_pos[1], start_pos[2])
-                            + self.end_pos[3:])
-            axes_d[0] = axes_d[1] = axes_d[2] = 0.
-            self.move_d = move_d = max([abs(ad) for ad in axes_d[3:]])
+            self.end_pos = start_pos[:3] + end_pos[3:]
+            axes_d = (0., 0., 0.) + axes_d[3:]
+            move_d = max([abs(ad) for ad in axes_d[3:]])
             inv_move_d = 0.
             if move_d:
                 inv_move_d = 1. / move_d
@@ -37,7 +52,9 @@ class Move:
             self.is_kinematic_move = False
         else:
             inv_move_d = 1. / move_d
-        self.axes_r = [d * inv_move_d for d in axes_d]
+        self.axes_d = axes_d
+        self.move_d = move_d
+        self.axes_r = tuple([d * inv_move_d for d in axes_d])
         self.min_move_t = move_d / velocity
         # Junction speeds are tracked in velocity squared.  The
         # delta_v2 is the maximum amount of this squared-velocity that
@@ -118,7 +135,8 @@ LOOKAHEAD_FLUSH_TIME = 0.150
 # Class to track a list of pending move requests and to facilitate
 # "look-ahead" across moves to reduce acceleration between moves.
 class LookAheadQueue:
-    def __init__(self):
+    def __init__(self, trapq_append_batch):
+        self.trapq_append_batch = trapq_append_batch
         self.queue = []
         self.junction_flush = LOOKAHEAD_FLUSH_TIME
     def reset(self):
@@ -132,6 +150,10 @@ class LookAheadQueue:
         if self.queue:
             return self.queue[-1]
         return None
+    def limit_next_junction_speed(self, speed):
+        last_move = self.get_last()
+        if last_move is not None:
+            last_move.limit_next_junction_speed(speed)
     def flush(self, lazy=False):
         self.junction_flush = LOOKAHEAD_FLUSH_TIME
         update_flush_count = lazy
@@ -139,8 +161,8 @@ class LookAheadQueue:
         flush_count = len(queue)
         # Traverse queue from last to first move and determine maximum
         # junction speed assuming the robot comes to a complete stop
-        # after the last move.
-        junction_info = [None] * flush_count
+        # after the last move.  The results are stored in the move's
+        # flush_* fields for use by the forward pass.
         next_start_v2 = next_mcr_start_v2 = peak_cruise_v2 = 0.
         pending_cv2_assign = 0
         for i in range(flush_count-1, -1, -1):
@@ -164,23 +186,26 @@ class LookAheadQueue:
                 cruise_v2 = min((start_v2 + reachable_start_v2) * .5
                                 , move.max_cruise_v2, peak_cruise_v2)
                 pending_cv2_assign = 0
-            junction_info[i] = (move, start_v2, cruise_v2, next_start_v2)
+            move.flush_start_v2 = start_v2
+            move.flush_cruise_v2 = cruise_v2
+            move.flush_end_v2 = next_start_v2
             next_start_v2 = start_v2
             next_mcr_start_v2 = mcr_start_v2
         if update_flush_count or not flush_count:
             return []
         # Traverse queue in forward direction to propagate cruise_v2
         prev_cruise_v2 = 0.
-        for i in range(flush_count):
-            move, start_v2, cruise_v2, next_start_v2 = junction_info[i]
+        res = queue[:flush_count]
+        for move in res:
+            start_v2 = move.flush_start_v2
+            cruise_v2 = move.flush_cruise_v2
             if cruise_v2 is None:
                 # This move can't accelerate - propagate cruise_v2 from previous
                 cruise_v2 = min(prev_cruise_v2, start_v2)
             move.set_junction(min(start_v2, cruise_v2), cruise_v2
-                              , min(next_start_v2, cruise_v2))
+                              , min(move.flush_end_v2, cruise_v2))
             prev_cruise_v2 = cruise_v2
         # Remove processed moves from the queue
-        res = queue[:flush_count]
         del queue[:flush_count]
         return res
     def add_move(self, move):
@@ -191,6 +216,101 @@ class LookAheadQueue:
         self.junction_flush -= move.min_move_t
         # Check if enough moves have been queued to reach the target flush time.
         return self.junction_flush <= 0.
+    def queue_trapq(self, trapq, print_time, moves):
+        # Add the kinematic moves returned by flush() to the trapq
+        moves_data = []
+        for move in moves:
+            if move.is_kinematic_move:
+                moves_data.extend((
+                    print_time, move.accel_t, move.cruise_t, move.decel_t,
+                    move.start_pos[0], move.start_pos[1], move.start_pos[2],
+                    move.axes_r[0], move.axes_r[1], move.axes_r[2],
+                    move.start_v, move.cruise_v, move.accel))
+            print_time = (print_time + move.accel_t
+                          + move.cruise_t + move.decel_t)
+        self.trapq_append_batch(trapq, moves_data)
+        return print_time
+
+# Look-ahead queue with the junction velocity calculations implemented
+# in the C helper code.  The C code retains the flushed moves so that
+# they can be added to the trapq without further Python processing.
+class CLookAheadQueue(LookAheadQueue):
+    def __init__(self, trapq_append_batch):
+        LookAheadQueue.__init__(self, trapq_append_batch)
+        ffi_main, ffi_lib = chelper.get_ffi()
+        self.ffi_main = ffi_main
+        clookahead = ffi_lib.lookahead_alloc()
+        if clookahead == ffi_main.NULL:
+            raise MemoryError("Unable to allocate lookahead queue")
+        self.clookahead = ffi_main.gc(clookahead, ffi_lib.lookahead_free)
+        self.lookahead_reset = ffi_lib.lookahead_reset
+        self.lookahead_add_move = ffi_lib.lookahead_add_move
+        self.lookahead_limit_next_junction = (
+            ffi_lib.lookahead_limit_next_junction)
+        self.lookahead_flush = ffi_lib.lookahead_flush
+        self.lookahead_queue_trapq = ffi_lib.lookahead_queue_trapq
+        self.results = self.results_d = None
+        self.results_size = 0
+        self._alloc_results(256)
+    def _alloc_results(self, size):
+        self.results = self.ffi_main.new("struct lookahead_result[]", size)
+        self.results_d = self.ffi_main.cast("double *", self.results)
+        self.results_size = size
+    def reset(self):
+        LookAheadQueue.reset(self)
+        self.lookahead_reset(self.clookahead)
+    def limit_next_junction_speed(self, speed):
+        LookAheadQueue.limit_next_junction_speed(self, speed)
+        self.lookahead_limit_next_junction(self.clookahead, speed**2)
+    def flush(self, lazy=False):
+        self.junction_flush = LOOKAHEAD_FLUSH_TIME
+        queue = self.queue
+        if len(queue) > self.results_size:
+            self._alloc_results(len(queue) * 2)
+        flush_count = self.lookahead_flush(self.clookahead, lazy, self.results)
+        if not flush_count:
+            return []
+        # Store the calculated velocities and times in the Move objects
+        vals = self.ffi_main.unpack(self.results_d, flush_count * 6)
+        res = queue[:flush_count]
+        pos = 0
+        for move in res:
+            (move.start_v, move.cruise_v, move.end_v,
+             move.accel_t, move.cruise_t, move.decel_t) = vals[pos:pos+6]
+            pos += 6
+        # Remove processed moves from the queue
+        del queue[:flush_count]
+        return res
+    def add_move(self, move):
+        queue = self.queue
+        queue.append(move)
+        # Allow extra axes to calculate maximum junction
+        extra_axes_v2 = max_cruise_v2 = move.max_cruise_v2
+        if (len(queue) > 1 and move.is_kinematic_move
+            and queue[-2].is_kinematic_move):
+            prev_move = queue[-2]
+            for e_index, ea in enumerate(move.toolhead.extra_axes):
+                extra_axes_v2 = min(extra_axes_v2, ea.calc_junction(
+                    prev_move, move, e_index + 3))
+        start_pos = move.start_pos
+        axes_r = move.axes_r
+        ret = self.lookahead_add_move(
+            self.clookahead, start_pos[0], start_pos[1], start_pos[2],
+            axes_r[0], axes_r[1], axes_r[2], move.move_d, move.accel,
+            move.junction_deviation, max_cruise_v2, move.delta_v2,
+            move.mcr_delta_v2, extra_axes_v2, move.is_kinematic_move)
+        if ret:
+            # Keep the python queue in sync with the C queue
+            queue.pop()
+            raise move.toolhead.printer.command_error(
+                "Internal error in lookahead queue")
+        if len(queue) == 1:
+            return
+        self.junction_flush -= move.min_move_t
+        # Check if enough moves have been queued to reach the target flush time.
+        return self.junction_flush <= 0.
+    def queue_trapq(self, trapq, print_time, moves):
+        return self.lookahead_queue_trapq(self.clookahead, trapq, print_time)
 
 BUFFER_TIME_HIGH = 1.0
 BUFFER_TIME_START = 0.250
@@ -202,8 +322,6 @@ class ToolHead:
         self.printer = config.get_printer()
         self.reactor = self.printer.get_reactor()
         self.mcu = self.printer.lookup_object('mcu')
-        self.lookahead = LookAheadQueue()
-        self.lookahead.set_flush_time(BUFFER_TIME_HIGH)
         self.commanded_pos = [0., 0., 0., 0.]
         # Velocity and acceleration control
         self.max_velocity = config.getfloat('max_velocity', above=0.)
@@ -231,7 +349,12 @@ class ToolHead:
         self.motion_queuing.register_flush_callback(self._handle_step_flush,
                                                     can_add_trapq=True)
         self.trapq = self.motion_queuing.allocate_trapq()
-        self.trapq_append = self.motion_queuing.lookup_trapq_append()
+        trapq_append_batch = self.motion_queuing.lookup_trapq_append_batch()
+        lookahead_queues = {'c': CLookAheadQueue, 'python': LookAheadQueue}
+        lookahead_class = config.getchoice('lookahead_queue',
+                                           lookahead_queues, 'c')
+        self.lookahead = lookahead_class(trapq_append_batch)
+        self.lookahead.set_flush_time(BUFFER_TIME_HIGH)
         # Create kinematics class
         gcode = self.printer.lookup_object('gcode')
         self.Coord = gcode.Coord
@@ -279,21 +402,15 @@ class ToolHead:
         # Queue moves into trapezoid motion queue (trapq)
         next_move_time = self.print_time
         with self.reactor.assert_no_pause():
+            self.lookahead.queue_trapq(self.trapq, next_move_time, moves)
+            for e_index, ea in enumerate(self.extra_axes):
+                ea.process_moves(next_move_time, moves, e_index + 3)
             for move in moves:
-                if move.is_kinematic_move:
-                    self.trapq_append(
-                        self.trapq, next_move_time,
-                        move.accel_t, move.cruise_t, move.decel_t,
-                        move.start_pos[0], move.start_pos[1], move.start_pos[2],
-                        move.axes_r[0], move.axes_r[1], move.axes_r[2],
-                        move.start_v, move.cruise_v, move.accel)
-                for e_index, ea in enumerate(self.extra_axes):
-                    if move.axes_d[e_index + 3]:
-                        ea.process_move(next_move_time, move, e_index + 3)
                 next_move_time = (next_move_time + move.accel_t
                                   + move.cruise_t + move.decel_t)
-                for cb in move.timing_callbacks:
-                    cb(next_move_time)
+                if move.timing_callbacks is not None:
+                    for cb in move.timing_callbacks:
+                        cb(next_move_time)
         # Generate steps for moves
         self._advance_move_time(next_move_time)
         self.motion_queuing.note_mcu_movequeue_activity(next_move_time)
@@ -389,9 +506,7 @@ class ToolHead:
         self.kin.set_position(newpos, homing_axes)
         self.printer.send_event("toolhead:set_position")
     def limit_next_junction_speed(self, speed):
-        last_move = self.lookahead.get_last()
-        if last_move is not None:
-            last_move.limit_next_junction_speed(speed)
+        self.lookahead.limit_next_junction_speed(speed)
     def move(self, newpos, speed):
         move = Move(self, self.commanded_pos, newpos, speed)
         if not move.move_d:
@@ -463,15 +578,8 @@ class ToolHead:
             self.lookahead.add_move(submit_move)
         moves = self.lookahead.flush()
         self._calc_print_time()
-        start_time = end_time = self.print_time
-        for move in moves:
-            self.trapq_append(
-                self.trapq, end_time,
-                move.accel_t, move.cruise_t, move.decel_t,
-                move.start_pos[0], move.start_pos[1], move.start_pos[2],
-                move.axes_r[0], move.axes_r[1], move.axes_r[2],
-                move.start_v, move.cruise_v, move.accel)
-            end_time = end_time + move.accel_t + move.cruise_t + move.decel_t
+        start_time = self.print_time
+        end_time = self.lookahead.queue_trapq(self.trapq, start_time, moves)
         self.lookahead.reset()
         return start_time, end_time
     def drip_move(self, newpos, speed, drip_completion):
@@ -528,6 +636,8 @@ class ToolHead:
         if last_move is None:
             callback(self.get_last_move_time())
             return
+        if last_move.timing_callbacks is None:
+            last_move.timing_callbacks = []
         last_move.timing_callbacks.append(callback)
     def get_max_velocity(self):
         return self.max_velocity, self.max_accel
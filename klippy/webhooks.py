@@ -3,7 +3,7 @@
 # Copyright (C) 2020 Eric Callahan <arksine.code@gmail.com>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license
-import logging, socket, os, sys, errno, collections
+import logging, socket, os, sys, errno, collections, math
 import gcode
 
 try:
@@ -194,8 +194,10 @@ class ClientConnection:
         self.sock = sock
         self.fd_handle = self.reactor.register_fd(
             self.sock.fileno(), self.process_received, self._do_send)
-        self.partial_data = self.send_buffer = b""
-        self.is_blocking = False
+        self.partial_data = b""
+        self.send_buffer = bytearray()
+        self.send_timer = self.reactor.register_timer(self._flush_send)
+        self.is_send_pending = self.is_blocking = False
         self.blocking_count = 0
         self.set_client_info("?", "New connection")
         self.request_log = collections.deque([], REQUEST_LOG_SIZE)
@@ -222,9 +224,16 @@ class ClientConnection:
     def close(self):
         if self.fd_handle is None:
             return
+        if self.send_buffer:
+            # Send any replies still waiting on the send timer (the
+            # reactor may have already stopped, eg, during a restart)
+            self._do_send()
+            if self.fd_handle is None:
+                return
         self.set_client_info(None, "Disconnected")
         self.reactor.unregister_fd(self.fd_handle)
         self.fd_handle = None
+        self.reactor.unregister_timer(self.send_timer)
         try:
             self.sock.close()
         except socket.error:
@@ -282,14 +291,23 @@ class ClientConnection:
     def send(self, data):
         try:
             jmsg = json_dumps(data)
-            self.send_buffer += jmsg + b"\x03"
         except (TypeError, ValueError) as e:
             msg = ("json encoding error: %s" % (str(e),))
             logging.exception(msg)
             self.printer.invoke_shutdown(msg)
             return
+        self.send_buffer += jmsg
+        self.send_buffer += b"\x03"
+        if not self.is_send_pending and not self.is_blocking:
+            # Coalesce all messages generated during this reactor tick
+            self.is_send_pending = True
+            self.reactor.update_timer(self.send_timer, self.reactor.NOW)
+
+    def _flush_send(self, eventtime):
+        self.is_send_pending = False
         if not self.is_blocking:
             self._do_send()
+        return self.reactor.NEVER
 
     def _do_send(self, eventtime=None):
         if self.fd_handle is None:
@@ -299,6 +317,7 @@ class ClientConnection:
         except socket.error as e:
             if e.errno not in [errno.EAGAIN, errno.EWOULDBLOCK]:
                 logging.info("webhooks: socket write error %d" % (self.uid,))
+                del self.send_buffer[:]
                 self.close()
                 return
             sent = 0
@@ -310,7 +329,7 @@ class ClientConnection:
         elif self.is_blocking:
             self.reactor.set_fd_wake(self.fd_handle, True, False)
             self.is_blocking = False
-        self.send_buffer = self.send_buffer[sent:]
+        del self.send_buffer[:sent]
 
 class WebHooks:
     def __init__(self, printer):
@@ -467,6 +486,23 @@ class GCodeHelper:
             self.is_output_registered = True
 
 SUBSCRIPTION_REFRESH_TIME = .25
+MIN_REFRESH_TIME = .05
+
+class QuerySubscription:
+    def __init__(self, cconn, objects, send_func, template,
+                 refresh_time=SUBSCRIPTION_REFRESH_TIME):
+        self.cconn = cconn
+        self.objects = objects
+        self.send_func = send_func
+        self.template = template
+        self.refresh_time = refresh_time
+        self.next_time = 0.
+        # The get_status() results this client was last updated with
+        self.last_status = {}
+    def set_next_time(self, eventtime):
+        # Align clients with the same rate so they share query results
+        rt = self.refresh_time
+        self.next_time = rt * (math.floor(eventtime / rt) + 1.)
 
 class QueryStatusHelper:
     def __init__(self, printer):
@@ -484,53 +520,96 @@ class QueryStatusHelper:
         objects = [n for n, o in self.printer.lookup_objects()
                    if hasattr(o, 'get_status')]
         web_request.send({'objects': objects})
+    def _query_object(self, obj_name, eventtime, last_query):
+        po = self.printer.lookup_object(obj_name, None)
+        if po is None or not hasattr(po, 'get_status'):
+            return None, {}
+        # Objects may provide a version that only changes when their
+        # get_status() results change
+        get_version = getattr(po, 'get_status_version', None)
+        if get_version is None:
+            return None, po.get_status(eventtime)
+        version = get_version()
+        last_version, last_res = last_query.get(obj_name, (None, None))
+        if last_res is not None and version == last_version:
+            return version, last_res
+        return version, po.get_status(eventtime)
     def _do_query(self, eventtime):
         last_query = self.last_query
         query = self.last_query = {}
         msglist = self.pending_queries
         self.pending_queries = []
-        msglist.extend(self.clients.values())
-        # Generate get_status() info for each client
         reactor = self.printer.get_reactor()
+        next_time = reactor.NEVER
+        for cconn, sub in list(self.clients.items()):
+            if cconn.is_closed():
+                del self.clients[cconn]
+                continue
+            if sub.next_time <= eventtime:
+                sub.set_next_time(eventtime)
+                msglist.append(sub)
+            next_time = min(next_time, sub.next_time)
+        # Results of comparing fields against a client's prior results
+        changes = {}
+        # Generate get_status() info for each client
         with reactor.assert_no_pause():
-            for cconn, subscription, send_func, template in msglist:
-                is_query = cconn is None
-                if not is_query and cconn.is_closed():
-                    del self.clients[cconn]
-                    continue
+            for sub in msglist:
+                is_query = sub.cconn is None
+                last_status = sub.last_status
                 # Query each requested printer object
                 cquery = {}
-                for obj_name, req_items in subscription.items():
-                    res = query.get(obj_name, None)
-                    if res is None:
-                        po = self.printer.lookup_object(obj_name, None)
-                        if po is None or not hasattr(po, 'get_status'):
-                            res = query[obj_name] = {}
-                        else:
-                            res = query[obj_name] = po.get_status(eventtime)
+                for obj_name, req_items in sub.objects.items():
+                    version_res = query.get(obj_name, None)
+                    if version_res is None:
+                        version_res = self._query_object(obj_name, eventtime,
+                                                         last_query)
+                        query[obj_name] = version_res
+                    res = version_res[1]
                     if req_items is None:
                         req_items = list(res.keys())
                         if req_items:
-                            subscription[obj_name] = req_items
-                    lres = last_query.get(obj_name, {})
+                            sub.objects[obj_name] = req_items
+                    lres = last_status.get(obj_name, {})
+                    last_status[obj_name] = res
+                    if is_query:
+                        cquery[obj_name] = {ri: res.get(ri, None)
+                                            for ri in req_items}
+                        continue
+                    if lres is res:
+                        # Object status unchanged
+                        continue
+                    # Clients updated with the same prior results share
+                    # the field comparisons
+                    ckey = (obj_name, id(lres))
+                    lres, ochanges = changes.setdefault(ckey, (lres, {}))
                     cres = {}
                     for ri in req_items:
                         rd = res.get(ri, None)
-                        if is_query or rd != lres.get(ri):
+                        is_change = ochanges.get(ri)
+                        if is_change is None:
+                            is_change = ochanges[ri] = rd != lres.get(ri)
+                        if is_change:
                             cres[ri] = rd
-                    if cres or is_query:
+                    if cres:
                         cquery[obj_name] = cres
                 # Send data
                 if cquery or is_query:
-                    tmp = dict(template)
+                    tmp = dict(sub.template)
                     tmp['params'] = {'eventtime': eventtime, 'status': cquery}
-                    send_func(tmp)
-        if not query:
+                    sub.send_func(tmp)
+        if not self.clients:
             # Unregister timer if there are no longer any subscriptions
             reactor.unregister_timer(self.query_timer)
             self.query_timer = None
             return reactor.NEVER
-        return eventtime + SUBSCRIPTION_REFRESH_TIME
+        return next_time
+    def _wake_timer(self):
+        reactor = self.printer.get_reactor()
+        if self.query_timer is None:
+            qt = reactor.register_timer(self._do_query, reactor.NOW)
+            self.query_timer = qt
+        else:
+            reactor.update_timer(self.query_timer, reactor.NOW)
     def _handle_query(self, web_request, is_subscribe=False):
         objects = web_request.get_dict('objects')
         # Validate subscription format
@@ -541,6 +620,11 @@ class QueryStatusHelper:
                 for ri in v:
                     if type(ri) != str:
                         raise web_request.error("Invalid argument")
+        refresh_time = SUBSCRIPTION_REFRESH_TIME
+        if is_subscribe:
+            refresh_time = web_request.get_float('refresh_time', refresh_time)
+            if refresh_time < MIN_REFRESH_TIME:
+                raise web_request.error("Invalid argument")
         # Add to pending queries
         cconn = web_request.get_client_connection()
         template = web_request.get_dict('response_template', {})
@@ -548,16 +632,19 @@ class QueryStatusHelper:
             del self.clients[cconn]
         reactor = self.printer.get_reactor()
         complete = reactor.completion()
-        self.pending_queries.append((None, objects, complete.complete, {}))
-        # Start timer if needed
-        if self.query_timer is None:
-            qt = reactor.register_timer(self._do_query, reactor.NOW)
-            self.query_timer = qt
+        query = QuerySubscription(None, objects, complete.complete, {})
+        self.pending_queries.append(query)
+        self._wake_timer()
         # Wait for data to be queried
         msg = complete.wait()
         web_request.send(msg['params'])
         if is_subscribe:
-            self.clients[cconn] = (cconn, objects, cconn.send, template)
+            sub = QuerySubscription(cconn, objects, cconn.send, template,
+                                    refresh_time)
+            sub.last_status = query.last_status
+            sub.set_next_time(msg['params']['eventtime'])
+            self.clients[cconn] = sub
+            self._wake_timer()
     def _handle_subscribe(self, web_request):
         self._handle_query(web_request, is_subscribe=True)
 
@@ -0,0 +1,328 @@
+#!/usr/bin/env python
+# Script to measure the processing rate of host (klippy) code paths
+#
+# Copyright (C) 2026  agent <agent@local>
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+import sys, os, optparse, math, time, tempfile, subprocess
+
+KLIPPY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          '..', 'klippy')
+
+class error(Exception):
+    pass
+
+def report(name, count, elapsed, units):
+    sys.stdout.write("%s: %d %s in %.3fs (%.0f %s/second)\n" % (
+        name, count, units, elapsed, count / elapsed, units))
+
+
+######################################################################
+# Move throughput (ToolHead.move() and lookahead)
+######################################################################
+
+# Generate a series of tiny extruding segments along a circle (similar
+# to arc converted or mesh split g-code)
+def gen_move_gcode(count, seg_len=0.2, radius=20., center=(50., 50.)):
+    out = ["G28", "G90", "M83", "G1 F6000"]
+    steps = int(2. * math.pi * radius / seg_len)
+    for i in range(count):
+        angle = 2. * math.pi * (i % steps) / steps
+        x = center[0] + radius * math.cos(angle)
+        y = center[1] + radius * math.sin(angle)
+        out.append("G1 X%.3f Y%.3f E%.5f" % (x, y, seg_len * .033))
+    out.append("M400")
+    return "\n".join(out) + "\n"
+
+def run_klippy(config_fname, dict_fname, gcode, tempdir):
+    gcode_fname = os.path.join(tempdir, "bench.gcode")
+    f = open(gcode_fname, 'w')
+    f.write(gcode)
+    f.close()
+    args = [sys.executable, os.path.join(KLIPPY_DIR, 'klippy.py'),
+            config_fname, '-i', gcode_fname, '-o', os.devnull,
+            '-d', dict_fname, '-l', os.path.join(tempdir, "bench.log")]
+    start_time = time.time()
+    res = subprocess.call(args)
+    elapsed = time.time() - start_time
+    if res:
+        raise error("klippy failed (see %s)"
+                    % (os.path.join(tempdir, "bench.log"),))
+    return elapsed
+
+def bench_moves(options):
+    if options.config is None or options.dictionary is None:
+        raise error("The moves benchmark requires a config and dictionary")
+    tempdir = tempfile.mkdtemp(prefix="benchmark_klippy_")
+    # Measure startup overhead so it can be removed from the result (the
+    # first run may include building the C helper code)
+    base_time = min([run_klippy(options.config, options.dictionary,
+                                gen_move_gcode(0), tempdir)
+                     for i in range(2)])
+    total_time = run_klippy(options.config, options.dictionary,
+                            gen_move_gcode(options.count), tempdir)
+    report("moves", options.count, max(total_time - base_time, .001), "moves")
+
+
+######################################################################
+# G-Code parsing and dispatch
+######################################################################
+
+# Minimal config wrapper used to create printer objects in-process
+class BenchConfig:
+    def __init__(self, printer):
+        self.printer = printer
+    def get_printer(self):
+        return self.printer
+
+# Move transform that discards all moves
+class NullMoveTransform:
+    def get_position(self):
+        return [0., 0., 0., 0.]
+    def move(self, newpos, speed):
+        pass
+
+def bench_gcode(options):
+    import reactor, klippy
+    from extras import gcode_move
+    # Responses are discarded
+    gcode_fd = os.open(os.devnull, os.O_RDWR)
+    printer = klippy.Printer(reactor.Reactor(), None, {'gcode_fd': gcode_fd})
+    gm = gcode_move.GCodeMove(BenchConfig(printer))
+    gm.set_move_transform(NullMoveTransform())
+    printer.send_event("klippy:ready")
+    gcode = printer.lookup_object('gcode')
+    lines = gen_move_gcode(options.count).split('\n')[1:-2]
+    script = '\n'.join(lines)
+    start_time = time.time()
+    gcode.run_script(script)
+    report("gcode", len(lines), time.time() - start_time, "lines")
+
+
+######################################################################
+# G-Code macro rendering
+######################################################################
+
+# A typical "PRINT_START" style macro
+BENCH_MACRO = """
+{% set bed = params.BED|default(60)|float %}
+{% set extruder = params.EXTRUDER|default(200)|float %}
+{% set vars = printer["gcode_macro _BENCH_VARS"] %}
+M140 S{bed}
+M104 S{extruder * 0.75}
+{% if printer.toolhead.homed_axes != "xyz" %}
+G28
+{% endif %}
+{% for pos in vars.purge_points %}
+G1 X{pos[0]} Y{pos[1]} F{vars.speed * 60}
+{% endfor %}
+G1 X{printer.toolhead.axis_maximum.x - 10} Z{vars.park_z}
+M190 S{bed}
+M109 S{extruder}
+"""
+
+# Printer object providing get_status() data similar to the toolhead
+class BenchStatusObject:
+    def __init__(self, status):
+        self.status = status
+    def get_status(self, eventtime):
+        return self.status
+
+def bench_macro(options):
+    import reactor, klippy, gcode
+    from extras import gcode_macro
+    gcode_fd = os.open(os.devnull, os.O_RDWR)
+    printer = klippy.Printer(reactor.Reactor(), None, {'gcode_fd': gcode_fd})
+    coord = gcode.Coord((100., 200., 300., 0.))
+    printer.add_object('toolhead', BenchStatusObject({
+        'homed_axes': "xyz", 'position': coord, 'axis_minimum': coord,
+        'axis_maximum': coord, 'max_velocity': 300., 'max_accel': 3000.,
+        'extruder': "extruder", 'stalls': 0, 'estimated_print_time': 10.}))
+    printer.add_object('gcode_macro _BENCH_VARS', BenchStatusObject({
+        'speed': 50, 'park_z': 10.,
+        'purge_points': [[i * 5., 2.] for i in range(10)]}))
+    pgm = gcode_macro.PrinterGCodeMacro(BenchConfig(printer))
+    printer.add_object('gcode_macro', pgm)
+    template = gcode_macro.TemplateWrapper(printer, pgm.env, "bench",
+                                           BENCH_MACRO)
+    params = {'BED': "60", 'EXTRUDER': "215"}
+    start_time = time.time()
+    for i in range(options.count):
+        context = pgm.create_template_context()
+        context['params'] = params
+        template.render(context)
+    report("macro render", options.count, time.time() - start_time,
+           "renders")
+
+
+######################################################################
+# Message encoding and decoding
+######################################################################
+
+# Encode every command and response in a data dictionary with sample
+# parameter values
+def gen_msgproto_messages(mp):
+    import msgproto
+    int_values = [3, 90, 1000, 250000, 123456789, -7]
+    out = []
+    for msgid, msgtype, msgformat in mp.get_messages():
+        if msgtype == 'output':
+            continue
+        mf = mp.lookup_command(msgformat)
+        params = []
+        for i, (name, t) in enumerate(mf.param_names):
+            if isinstance(t, msgproto.Enumeration):
+                params.append(sorted(t.enums)[0])
+            elif t.is_dynamic_string:
+                params.append(list(range(i, i + 12)))
+            else:
+                params.append(int_values[i % len(int_values)])
+        cmd = mf.encode(params)
+        msglen = msgproto.MESSAGE_MIN + len(cmd)
+        if msglen > msgproto.MESSAGE_MAX:
+            continue
+        block = [msglen, msgproto.MESSAGE_DEST] + cmd
+        block += msgproto.crc16_ccitt(block) + [msgproto.MESSAGE_SYNC]
+        out.append((mf, params, bytearray(block)))
+    return out
+
+def bench_msgproto(options):
+    import msgproto, parsedump
+    if options.dictionary is None:
+        raise error("The msgproto benchmark requires a dictionary")
+    mp = msgproto.MessageParser()
+    mp.process_identify(parsedump.read_dictionary(options.dictionary),
+                        decompress=False)
+    messages = gen_msgproto_messages(mp)
+    rounds = max(1, options.count // len(messages))
+    count = rounds * len(messages)
+    start_time = time.time()
+    for i in range(rounds):
+        for mf, params, block in messages:
+            mp.parse(block)
+    report("msgproto parse", count, time.time() - start_time, "messages")
+    start_time = time.time()
+    for i in range(rounds):
+        for mf, params, block in messages:
+            mf.encode(params)
+    report("msgproto encode", count, time.time() - start_time, "messages")
+    start_time = time.time()
+    for i in range(rounds):
+        for mf, params, block in messages:
+            mp.check_packet(block)
+    report("msgproto check_packet", count, time.time() - start_time,
+           "messages")
+
+
+######################################################################
+# Reactor timer dispatch
+######################################################################
+
+BENCH_IDLE_TIMERS = 500
+
+def bench_reactor(options):
+    import reactor, random
+    r = reactor.Reactor()
+    random.seed(0)
+    # Many mostly idle timers (similar to heater, fan, and sensor timers)
+    def idle_callback(eventtime):
+        return eventtime + 1. + random.random()
+    start_time = r.monotonic()
+    idle_timers = [r.register_timer(idle_callback,
+                                    start_time + 1. + random.random())
+                   for i in range(BENCH_IDLE_TIMERS)]
+    # A busy timer that also reschedules idle timers (similar to moves
+    # resetting the idle timeout)
+    counts = [0]
+    def busy_callback(eventtime):
+        counts[0] += 1
+        if counts[0] >= options.count:
+            r.end()
+            return r.NEVER
+        timer = idle_timers[counts[0] % BENCH_IDLE_TIMERS]
+        r.update_timer(timer, eventtime + 1. + random.random())
+        return r.NOW
+    r.register_timer(busy_callback, r.NOW)
+    start_time = time.time()
+    r.run()
+    report("reactor", counts[0], time.time() - start_time, "callbacks")
+    r.finalize()
+
+
+######################################################################
+# Host startup time
+######################################################################
+
+STARTUP_RUNS = 10
+
+# Code run in a new process to time C helper loading (either via the
+# cached cffi module or by parsing all the C declarations)
+STARTUP_CODE = """
+import sys, time
+sys.path.insert(0, %s)
+start_time = time.time()
+import chelper
+if %s:
+    chelper.get_ffi()
+else:
+    ffi_main = chelper.cffi.FFI()
+    for d in chelper.defs_all:
+        ffi_main.cdef(d)
+    ffi_main.dlopen(chelper.check_build_c_library())
+sys.stdout.write("%%.6f\\n" %% (time.time() - start_time,))
+"""
+
+def run_startup_code(use_cache):
+    code = STARTUP_CODE % (repr(KLIPPY_DIR), repr(use_cache))
+    out = subprocess.check_output([sys.executable, '-c', code])
+    return float(out.strip())
+
+def bench_startup(options):
+    # First run may build the C helper code and cffi module
+    run_startup_code(True)
+    for use_cache, name in [(True, "cached"), (False, "cdef")]:
+        times = [run_startup_code(use_cache) for i in range(STARTUP_RUNS)]
+        sys.stdout.write("startup chelper %s: min %.6fs avg %.6fs\n" % (
+            name, min(times), sum(times) / len(times)))
+    if options.config is None or options.dictionary is None:
+        return
+    tempdir = tempfile.mkdtemp(prefix="benchmark_klippy_")
+    times = [run_klippy(options.config, options.dictionary,
+                        gen_move_gcode(0), tempdir)
+             for i in range(STARTUP_RUNS)]
+    sys.stdout.write("startup klippy: min %.3fs avg %.3fs\n" % (
+        min(times), sum(times) / len(times)))
+
+
+######################################################################
+# Startup
+######################################################################
+
+BENCHMARKS = {
+    "moves": bench_moves, "gcode": bench_gcode, "reactor": bench_reactor,
+    "msgproto": bench_msgproto, "startup": bench_startup,
+    "macro": bench_macro,
+}
+
+def main():
+    usage = "%prog [options] <benchmark>"
+    opts = optparse.OptionParser(usage)
+    opts.add_option("-c", "--config", dest="config",
+                    help="printer config file for klippy based benchmarks")
+    opts.add_option("-d", "--dictionary", dest="dictionary",
+                    help="mcu data dictionary for klippy based benchmarks")
+    opts.add_option("-n", "--count", dest="count", type="int", default=100000,
+                    help="number of iterations (default 100000)")
+    options, args = opts.parse_args()
+    if len(args) != 1 or args[0] not in BENCHMARKS:
+        opts.error("Benchmark must be one of: %s"
+                   % (", ".join(sorted(BENCHMARKS)),))
+    sys.path.insert(0, KLIPPY_DIR)
+    try:
+        BENCHMARKS[args[0]](options)
+    except error as e:
+        sys.stderr.write("ERROR: %s\n" % (str(e),))
+        sys.exit(-1)
+
+if __name__ == '__main__':
+    main()
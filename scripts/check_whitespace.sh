@@ -15,4 +15,7 @@ WS_FILES="$WS_FILES -o -name '*.yaml' -o -name '*.yml'"
 WS_FILES="$WS_FILES -o -name '*.css' -o -name '*.yaml' -o -name '*.yml'"
 WS_FILES="$WS_FILES -o -name '*.test' -o -name '*.config'"
 WS_FILES="$WS_FILES -o -iname '*.lds' -o -iname 'Makefile' -o -iname 'Kconfig'"
-eval find $WS_DIRS $WS_EXCLUDE $WS_FILES | xargs ./scripts/check_whitespace.py
+# Skip generated files
+WS_GENERATED="^klippy/chelper/c_helper_ffi.py$"
+eval find $WS_DIRS $WS_EXCLUDE $WS_FILES | grep -v "$WS_GENERATED" \
+    | xargs ./scripts/check_whitespace.py
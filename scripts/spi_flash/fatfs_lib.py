@@ -5,6 +5,7 @@
 # This file may be distributed under the terms of the GNU GPLv3 license.
 import os
 import sys
+import cffi
 KLIPPER_DIR = os.path.abspath(os.path.join(
     os.path.dirname(__file__), "../../"))
 sys.path.append(os.path.join(KLIPPER_DIR, "klippy"))
@@ -60,7 +61,7 @@ fatfs_ffi_lib = None
 
 def check_fatfs_build(printfunc=lambda o: o):
     printfunc("Checking FatFS CFFI Build...\n")
-    ffi_main, ffi_lib = chelper.get_ffi()
+    ffi_main = cffi.FFI()
     srcdir = os.path.dirname(os.path.realpath(__file__))
     srcfiles = chelper.get_abs_files(FATFS_DIR, FATFS_SRC)
     srcfiles.extend(chelper.get_abs_files(srcdir, SPI_FLASH_SRC))